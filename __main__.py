@@ -1,12 +1,12 @@
 import sys
 import os
+import csv
+import json
 import numpy as np
-import matplotlib.pyplot as plt
 
-from matplotlib.ticker import MaxNLocator
-
-from cfr_original import OriginalCFR
+from cfr import CFR
 from cfr_potential import PotentialCFR
+from metrics import get_column_layout, get_results, iter_strategy_rows
 
 from congestion_simple import SimpleCongestionGame
 from congestion_complex import ComplexCongestionGame
@@ -16,10 +16,13 @@ LINE_STYLES = ['-', '--', '-.', (0, (3, 1, 1, 1, 1, 1)), ':']
 LINE_COLORS = ['#47a', '#e67', '#283', '#cb4', '#a37']
 
 
-def plot_regrets(zerosum, potential, gamename, out_file=""):
+def plot_regrets(zerosum, potential, with_information, gamename, out_file=""):
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import MaxNLocator
+
     fig, ax = plt.subplots()
 
-    zerosum['Sum'] = zerosum[['Player 1', 'Player 2']].sum(axis=1)
+    zerosum['Sum'] = zerosum[zerosum.columns[1:]].sum(axis=1)
     ax.plot(zerosum['Iteration'], zerosum['Sum'],
             label="Zero-sum",
             linewidth=LINE_WIDTH,
@@ -64,21 +67,59 @@ def plot_regrets(zerosum, potential, gamename, out_file=""):
 
 
 def kl_divergence(p, q):
-    return sum(p[i] * np.log(p[i] / q[i]) for i in p)
+    # Actions with zero probability in p add nothing to the divergence.
+    ratio = np.divide(p, q, out=np.ones_like(p), where=p > 0)
+    with np.errstate(divide="ignore"):
+        return (p * np.log(ratio)).sum(axis=-1)
 
 
 def js_divergence(p, q):
-    m = {a: (p[a] + q[a]) / 2 for a in p}
+    m = (p + q) / 2
     return 0.5 * (kl_divergence(p, m) + kl_divergence(q, m))
 
 
+def get_position(key):
+    # CFR keys infostates by (position, accompanying players), PotentialCFR
+    # by position alone.
+    return key[0] if isinstance(key, tuple) else key
+
+
+def get_strategy_divergence(zerosum, potential, chunk_size=1024):
+    # Average JS divergence over infostates for every snapshot, computed on
+    # (snapshot, infostate, action) arrays one chunk of snapshots at a time.
+    # Each zero-sum infostate is compared to the potential strategy at its
+    # position.
+    if not len(zerosum):
+        return np.zeros(0)
+    layout = get_column_layout(zerosum[0])
+    potential_layout = [(get_position(key), action) for key, action in layout]
+    missing = set(potential_layout) - set(get_column_layout(potential[0]))
+    if missing:
+        raise ValueError("Potential strategies have no columns for %s."
+                         % ", ".join(map(repr, sorted(missing, key=repr))))
+    keys, widths = {}, {}
+    infostates, slots = [], []
+    for key, _ in layout:
+        infostates.append(keys.setdefault(key, len(keys)))
+        slots.append(widths.get(key, 0))
+        widths[key] = slots[-1] + 1
+    shape = (len(keys), max(slots) + 1)
+
+    divergence = []
+    for p_rows, q_rows in zip(iter_strategy_rows(zerosum, layout, chunk_size),
+                              iter_strategy_rows(potential, potential_layout, chunk_size)):
+        p = np.zeros((len(p_rows),) + shape)
+        q = np.zeros((len(q_rows),) + shape)
+        p[:, infostates, slots] = p_rows
+        q[:, infostates, slots] = q_rows
+        divergence.append(js_divergence(p, q).mean(axis=1))
+    return np.concatenate(divergence)
+
+
 def plot_strategies(zerosum, potential, with_information, gamename, out_file=""):
-    divergence_avg = []
-    for t in range(len(zerosum)):
-        divergence_sum = 0
-        for i in zerosum[t]:
-            divergence_sum += js_divergence(zerosum[t][i], potential[t][i])
-        divergence_avg += [divergence_sum / len(zerosum[t])]
+    divergence_avg = get_strategy_divergence(zerosum, potential)
+
+    import matplotlib.pyplot as plt
 
     iterations = range(1, len(zerosum) + 1)
     fig, ax = plt.subplots()
@@ -99,41 +140,99 @@ def plot_strategies(zerosum, potential, with_information, gamename, out_file="")
         plt.savefig(out_file)
 
 
-def plot_exploitability(game, gamename, out_file=""):
-    pass
+def plot_exploitability(zerosum, potential, gamename, out_file=""):
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import MaxNLocator
+
+    fig, ax = plt.subplots()
+
+    for i, (label, table) in enumerate((("Zero-sum", zerosum),
+                                        ("Potential", potential))):
+        if table:
+            iterations, exploitability = zip(*table)
+            ax.plot(iterations, exploitability,
+                    label=label,
+                    linewidth=LINE_WIDTH,
+                    linestyle=LINE_STYLES[i],
+                    color=LINE_COLORS[i])
+
+    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+
+    ax.set_xlabel('Iteration')
+    ax.set_ylabel('Exploitability')
+    ax.set_title('Exploitability on ' + gamename)
+    ax.legend()
+
+    if not out_file:
+        plt.show()
+    else:
+        plt.savefig(out_file)
+
+
+def write_results(solver, out_file):
+    results = get_results(solver)
+    with open(out_file + "_regret.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(results["regret_columns"])
+        writer.writerows(results["regret_table"])
+
+    with open(out_file + "_exploitability.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Iteration", "Exploitability"])
+        writer.writerows(results["exploitability_table"])
+
+    with open(out_file + "_strategies.json", "w") as f:
+        json.dump({"iterations": results["iterations"],
+                   "exploitability": results["exploitability"],
+                   "strategies": results["strategies"]}, f, indent=1)
 
 
 def main(args, out_folder):
     num_players = 2
     epsilon = .0001
+    iterations = 20000
+    with_information = '-info' in args
+    headless = '-headless' in args
 
     for arg in args:
         if arg == '-3p':
             num_players = 3
+        if arg.startswith('-iterations='):
+            iterations = int(arg.split('=', 1)[1])
         try:
             epsilon = -float(arg)
         except ValueError:
             pass
 
+    suffix = "_info" if with_information else ""
     if '-complex' in args:
-        game = ComplexCongestionGame(num_players)
+        game = ComplexCongestionGame(num_players, with_information)
         gamename = str(num_players) + "-player Complex Congestion Game"
-        out_folder += '/complex_' + str(num_players) + "p"
+        out_folder += '/complex_' + str(num_players) + "p" + suffix
     else:
-        game = SimpleCongestionGame(num_players)
+        game = SimpleCongestionGame(num_players, with_information)
         gamename = str(num_players) + "-player Simple Congestion Game"
-        out_folder += '/simple_' + str(num_players) + "p"
+        out_folder += '/simple_' + str(num_players) + "p" + suffix
+    os.makedirs(os.path.dirname(out_folder), exist_ok=True)
+
+    exploitability_rate = 100
 
-    zerosum = OriginalCFR(game)
-    iterations = zerosum.train(iterations=20000)
+    zerosum = CFR(game)
+    iterations = zerosum.train(iterations=iterations,
+                               exploitability_rate=exploitability_rate)
     potential = PotentialCFR(game)
-    potential.train(iterations=iterations)
+    potential.train(iterations=iterations,
+                    exploitability_rate=exploitability_rate)
+
+    if headless:
+        write_results(zerosum, out_folder + "_zerosum")
+        write_results(potential, out_folder + "_potential")
+        return
 
     zerosum_regrets = zerosum.get_regret_table()
     potential_regrets = potential.get_regret_table()
-    plot_regrets(zerosum_regrets, potential_regrets,
+    plot_regrets(zerosum_regrets, potential_regrets, with_information,
                  gamename, out_folder + "_regret")
-
     zerosum_strategy = zerosum.get_average_strategies()
     potential_strategy = potential.get_average_strategies()
     print(zerosum_strategy)
@@ -143,8 +242,10 @@ def main(args, out_folder):
     # potential_strategies = potential.get_strategy_list()
     # plot_strategies(zerosum_strategies, potential_strategies, with_information,
     #                 gamename, out_folder + "_strategies")
-    #
-    # plot_exploitability(game, gamename, out_folder + "_exploitability")
+
+    plot_exploitability(zerosum.get_exploitability_table(),
+                        potential.get_exploitability_table(),
+                        gamename, out_folder + "_exploitability")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import numpy as np
+
+from itertools import product
+
+from cfr import CFR
+from cfr_potential import PotentialCFR
+from congestion_simple import SimpleCongestionGame
+from congestion_complex import ComplexCongestionGame
+from instrumentation import Instrumentation
+
+
+GAMES = {"simple": SimpleCongestionGame, "complex": ComplexCongestionGame}
+SOLVERS = {"cfr": CFR, "potential": PotentialCFR}
+
+# Metrics compared against a baseline and whether a larger value is better.
+COMPARED = {"iterations_per_second": True, "nodes_per_second": True,
+            "time_to_epsilon": False, "peak_memory_bytes": False}
+
+
+def get_cases(games=GAMES, players=(2, 3), information=(False, True),
+              solvers=SOLVERS):
+    return [{"game": g, "players": n, "with_information": info, "solver": s}
+            for g, n, info, s in product(games, players, information, solvers)]
+
+
+def get_case_name(case):
+    return "%s_%dp%s_%s" % (case["game"], case["players"],
+                            "_info" if case["with_information"] else "",
+                            case["solver"])
+
+
+def make_solver(case, seed):
+    game = GAMES[case["game"]](case["players"], case["with_information"])
+    return SOLVERS[case["solver"]](game, seed=seed)
+
+
+def is_converged(regret, epsilon, num_players):
+    if isinstance(regret, list):
+        return all(r < epsilon / num_players for r in regret)
+    return regret <= epsilon
+
+
+def count_nodes(solver, iterations):
+    instrumentation = solver.instrument(Instrumentation())
+    solver.train(iterations, update_rate=iterations + 1)
+    solver.instrument()
+    return instrumentation.counters["nodes_visited"] / iterations
+
+
+def run_case(case, iterations, epsilon, max_iterations, repeat, seed):
+    result = dict(case, name=get_case_name(case))
+
+    solver = make_solver(case, seed)
+    start = time.perf_counter()
+    tree = solver.get_tree()
+    result["compile_seconds"] = time.perf_counter() - start
+    result["nodes"] = tree.get_num_nodes()
+    result["infostates"] = tree.get_num_infostates()
+
+    seconds = np.inf
+    for _ in range(repeat):
+        solver = make_solver(case, seed)
+        solver.get_tree()
+        start = time.perf_counter()
+        solver.train(iterations, update_rate=iterations + 1)
+        seconds = min(seconds, time.perf_counter() - start)
+    result["iterations"] = iterations
+    result["seconds"] = seconds
+    result["iterations_per_second"] = iterations / seconds
+
+    solver = make_solver(case, seed)
+    result["nodes_per_iteration"] = count_nodes(solver, min(iterations, 50))
+    result["nodes_per_second"] = result["nodes_per_iteration"] * iterations / seconds
+
+    tracemalloc.start()
+    solver = make_solver(case, seed)
+    solver.train(min(iterations, 50), update_rate=1)
+    result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    solver = make_solver(case, seed)
+    solver.get_tree()
+    solver.t = 0
+    start = time.perf_counter()
+    result["time_to_epsilon"] = None
+    result["iterations_to_epsilon"] = None
+    while solver.t < max_iterations:
+        regret = solver.training_iteration(max_iterations + 1)
+        if is_converged(regret, epsilon, case["players"]):
+            result["time_to_epsilon"] = time.perf_counter() - start
+            result["iterations_to_epsilon"] = solver.t
+            break
+    result["epsilon"] = epsilon
+
+    return result
+
+
+def compare(results, baseline, tolerance):
+    baseline = {r["name"]: r for r in baseline["results"]}
+    regressions = []
+    print("%-32s %-22s %12s %12s %8s" % ("case", "metric", "baseline", "current", "ratio"))
+    for result in results:
+        old = baseline.get(result["name"])
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            if result.get(metric) is None or old.get(metric) is None:
+                continue
+            ratio = result[metric] / old[metric] if old[metric] else np.inf
+            speedup = ratio if higher_is_better else 1 / ratio
+            flag = ""
+            if speedup < 1 - tolerance:
+                flag = " REGRESSION"
+                regressions.append((result["name"], metric))
+            print("%-32s %-22s %12.4g %12.4g %8.3f%s"
+                  % (result["name"], metric, old[metric], result[metric], ratio, flag))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the CFR solvers.")
+    parser.add_argument("--out", default="benchmark.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--epsilon", type=float, default=0.01)
+    parser.add_argument("--max-iterations", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--games", nargs="+", default=list(GAMES), choices=GAMES)
+    parser.add_argument("--players", nargs="+", type=int, default=[2, 3])
+    parser.add_argument("--solvers", nargs="+", default=list(SOLVERS), choices=SOLVERS)
+    args = parser.parse_args(argv)
+
+    results = []
+    for case in get_cases(args.games, args.players, (False, True), args.solvers):
+        result = run_case(case, args.iterations, args.epsilon, args.max_iterations,
+                          args.repeat, args.seed)
+        print("%-32s %10.1f it/s %12.0f nodes/s %10d B  to epsilon: %s"
+              % (result["name"], result["iterations_per_second"],
+                 result["nodes_per_second"], result["peak_memory_bytes"],
+                 "-" if result["time_to_epsilon"] is None
+                 else "%.3fs" % result["time_to_epsilon"]))
+        results.append(result)
+
+    report = {"python": platform.python_version(), "numpy": np.__version__,
+              "platform": platform.platform(), "time": time.time(),
+              "settings": vars(args), "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
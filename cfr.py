@@ -1,167 +1,259 @@
 import numpy as np
-import pandas as pd
 
-from random import choices
+from regret_store import RegretStore
+from solver import Solver
 
 
 class RegretMinimizer:
-    def __init__(self, actions, num_players):
-        self.num_actions = len(actions)
+    def __init__(self, actions, num_players, store=None, player=0):
+        self.actions = list(actions)
+        self.num_actions = len(self.actions)
 
-        self.regret_sum = {a: 0 for a in actions}
-        self.strategy_sum = {a: 0 for a in actions}
-        self.reach_sum = 0
-
-        self.action_util: dict[list[float]] = {}
-        self.infostate_util = [0] * num_players
+        self.store = store if store is not None \
+            else RegretStore((num_players,), num_owners=num_players)
+        self.index = self.store.add(self, player)
 
     def reset_utilities(self):
-        self.action_util: dict[list[float]] = {}
-        self.infostate_util = [0] * len(self.infostate_util)
+        self.action_util.fill(0)
+        self.infostate_util.fill(0)
 
     def get_next_strategy(self):
-        positive_regrets = {a: max(self.regret_sum[a], 0) for a in self.regret_sum}
-        total = sum(positive_regrets.values())
-        return {a: (positive_regrets[a] / total)
-                if total > 0 else (1 / self.num_actions)
-                for a in self.regret_sum}
-
-    def update_regret(self, player, reach):
-        for a in self.regret_sum:
-            action_utility = self.action_util[a][player]
-            imm_regret = (action_utility - self.infostate_util[player]) * reach
-            self.regret_sum[a] += imm_regret
-            pass
-
-    def update_strategy_sum(self, strategy, reach, t):
-        for a in self.strategy_sum:
-            self.strategy_sum[a] += strategy[a] * reach * t
-        self.reach_sum += reach * t
-        pass
-
-    def get_average_strategy(self):
-        return {a: (self.strategy_sum[a] / self.reach_sum)
-                if self.reach_sum > 0 else (1 / self.num_actions)
-                for a in self.strategy_sum}
-
-    def get_average_regret(self, t):
-        return max(self.regret_sum.values()) / t if self.num_actions > 0 else 0
-
-
-class CFR:
-    def __init__(self, game):
-        self.game = game
-        self.regret_minimizers = {}
-        self.t = 1
-        self.regret_table = []
-        self.strategy_list = []
-        self.all_strategies = [1] * game.get_num_players()
-        self.last_time = [""] * game.get_num_players()
-
-    def walk_trees(self, reach=1, info_reach=1):
-        if self.game.is_terminal():
-            u = self.game.get_utility()
-            return u, reach
-
-        player = self.game.get_next_player()
-        infostate = self.game.get_infostate()
-        actions = self.game.get_valid_actions()
-
-        if (player, infostate) not in self.regret_minimizers:
-            self.regret_minimizers[(player, infostate)] = \
-                RegretMinimizer(actions, self.game.get_num_players())
-        rm = self.regret_minimizers[(player, infostate)]
-        strategy = rm.get_next_strategy()
-        rm.update_strategy_sum(strategy, info_reach, self.t)
-
-        rm.reset_utilities()
-        if not any(self.game.get_scheduled_actions()):
-            all_strategies = self.all_strategies.copy()
-            self.all_strategies = [1] * self.game.get_num_players()
-
-        for a in actions:
-            new_reach = reach * strategy[a]
+        positive_regrets = np.maximum(self.regret_sum, 0)
+        total = positive_regrets.sum()
+        if total > 0:
+            return positive_regrets / total
+        return np.full(self.num_actions, 1 / self.num_actions)
 
-            self.all_strategies[player] = strategy[a]
-            self.last_time[player] = a
+    def update_regret(self, player, reach, weight=1):
+        imm_regret = (self.action_util[:, player] - self.infostate_util[player]) * reach * weight
+        self.add_regret(imm_regret)
 
-            self.game.take_action(a)
-
-            if self.game.get_next_player() <= player:
-                rm.action_util[a], action_reach = self.walk_trees(new_reach, new_reach)
-            else:
-                rm.action_util[a], action_reach = self.walk_trees(new_reach, info_reach)
+    def add_regret(self, regret):
+        self.regret_sum += regret
+        self.store.set_max_regret(self.index, self.regret_sum.max())
 
-            self.game.undo_action()
+    def update_strategy_sum(self, strategy, reach, weight):
+        self.strategy_sum += strategy * reach * weight
+        self.reach_sum += reach * weight
 
-            other_reach = np.prod([s for i, s in enumerate(self.all_strategies) if i != player])
-            action_util = [u_i * strategy[a] * other_reach for u_i in rm.action_util[a]]
-            rm.infostate_util = np.add(rm.infostate_util, action_util)
-            pass
+    def get_average_strategy(self):
+        if self.reach_sum[0] > 0:
+            avg_strategy = self.strategy_sum / self.reach_sum[0]
+        else:
+            avg_strategy = np.full(self.num_actions, 1 / self.num_actions)
+        return dict(zip(self.actions, avg_strategy))
 
-        rm.update_regret(player, action_reach)
+    def get_average_regret(self, t):
+        return self.regret_sum.max() / t if self.num_actions > 0 else 0
 
-        if not any(self.game.get_scheduled_actions()):
-            self.all_strategies = all_strategies
-            action_reach = reach
 
-        return rm.infostate_util, action_reach
+class CFR(Solver):
+    def __init__(self, game, metrics_prefix=None, buffer_size=1024, variant="vanilla",
+                 snapshot_encoding="dense", seed=None, transpositions=False):
+        num_players = game.get_num_players()
+        super().__init__(game, RegretStore((num_players,), num_owners=num_players),
+                         lambda key: key[1], metrics_prefix, buffer_size, variant,
+                         snapshot_encoding, seed)
+        self.transpositions = transpositions
+        self.transposition_hits = 0
+        self.transposition_misses = 0
 
-    def get_average_strategies(self):
+    def add_regret_minimizers(self):
         num_players = self.game.get_num_players()
-        avg_strategies = {}
-        for i in self.regret_minimizers:
-            rm = self.regret_minimizers[i]
-            avg_strategy = rm.get_average_strategy()
+        for i in range(len(self.regret_minimizers), len(self.registry)):
+            self.regret_minimizers.append(
+                RegretMinimizer(self.registry.actions[i], num_players,
+                                self.store, self.registry.players[i]))
+
+    def get_terminal_utility(self):
+        return self.tree.utility
+
+    def walk_trees(self, node, reach=1, info_reach=1, round_reach=1):
+        # round_reach is the probability of this round's actions by the players
+        # before the acting one, and the returned tail reach that of the last
+        # actions explored for the players after it. Their product is the
+        # counterfactual reach of the acting player.
+        tree = self.tree
+        if tree.terminal[node] >= 0:
+            return self.get_terminal_utility()[tree.terminal[node]], reach, 1
+
+        player = tree.player[node]
+        rm = self.regret_minimizers[tree.infostate[node]]
+        strategy = rm.get_next_strategy()
+        rm.update_strategy_sum(strategy, info_reach, self.strategy_weight)
 
-            if i[1] not in avg_strategies:
-                avg_strategies[i[1]] = {a: avg_strategy[a] / num_players for a in avg_strategy}
+        rm.reset_utilities()
+        if tree.round_start[node]:
+            round_reach = 1
+
+        first_child = tree.first_child[node]
+        for j in range(rm.num_actions):
+            child = first_child + j
+            p = strategy[j]
+            new_reach = reach * p
+
+            if tree.round_start[child]:
+                rm.action_util[j], action_reach, tail_reach = \
+                    self.walk_trees(child, new_reach, new_reach)
             else:
-                for j in avg_strategies[i[1]]:
-                    avg_strategies[i[1]][j] += avg_strategy[j] / num_players
-
-        return avg_strategies
+                rm.action_util[j], action_reach, tail_reach = \
+                    self.walk_trees(child, new_reach, info_reach, round_reach * p)
+
+            rm.infostate_util += rm.action_util[j] * p * (round_reach * tail_reach)
+
+        rm.update_regret(player, action_reach, self.regret_weight)
+
+        if tree.round_start[node]:
+            return rm.infostate_util, reach, 1
+        return rm.infostate_util, action_reach, p * tail_reach
+
+    def walk_stack(self, root, reach=1, strategies=None, entry_utility=None):
+        # Same traversal as walk_trees on an explicit stack of frames, one per
+        # depth, so deep trees don't hit the recursion limit. The transposition
+        # mode passes frozen strategies, and the utilities of the entries below
+        # root, which are then leaves.
+        tree = self.tree
+        terminal, players, infostates, first_child, round_start = tree.get_node_lists()
+        entry = tree.get_transpositions()[0] if entry_utility is not None else None
+        utility = self.get_terminal_utility()
+        minimizers = self.regret_minimizers
+        strategy_weight = self.strategy_weight
+        regret_weight = self.regret_weight
+        frames = self.frames
+        nodes_visited = terminals_evaluated = 0
+
+        depth = 0
+        node, info_reach, round_reach = root, reach, 1
+        while True:
+            nodes_visited += 1
+            if terminal[node] >= 0:
+                terminals_evaluated += 1
+                result = utility[terminal[node]], reach, 1
+            elif entry is not None and depth and entry[node] >= 0:
+                result = entry_utility[entry[node]], reach, 1
+            else:
+                rm = minimizers[infostates[node]]
+                strategy = rm.get_next_strategy() if strategies is None \
+                    else strategies[infostates[node]]
+                rm.update_strategy_sum(strategy, info_reach, strategy_weight)
+                # Every action utility is written before it is read.
+                rm.infostate_util.fill(0)
+                if round_start[node]:
+                    round_reach = 1
+                if depth == len(frames):
+                    frames.append([None] * 7)
+                frame = frames[depth]
+                frame[0], frame[1], frame[2], frame[3] = node, rm, strategy, -1
+                frame[4], frame[5], frame[6] = reach, info_reach, round_reach
+                depth += 1
+                result = None
+
+            while depth:
+                frame = frames[depth - 1]
+                parent, rm, strategy, j, parent_reach, info_reach, round_reach = frame
+                if result is not None:
+                    child_util, action_reach, tail_reach = result
+                    p = strategy[j]
+                    rm.action_util[j] = child_util
+                    rm.infostate_util += child_util * p * (round_reach * tail_reach)
+
+                j += 1
+                if j < rm.num_actions:
+                    frame[3] = j
+                    node = first_child[parent] + j
+                    p = strategy[j]
+                    reach = parent_reach * p
+                    if round_start[node]:
+                        info_reach = reach
+                    round_reach = round_reach * p
+                    break
+
+                rm.update_regret(players[parent], action_reach, regret_weight)
+                if round_start[parent]:
+                    result = rm.infostate_util, parent_reach, 1
+                else:
+                    result = rm.infostate_util, action_reach, p * tail_reach
+                depth -= 1
+            else:
+                instrumentation = self.instrumentation
+                instrumentation.count("nodes_visited", nodes_visited)
+                instrumentation.count("terminals_evaluated", terminals_evaluated)
+                return result
+
+    def walk_transpositions(self):
+        # With the strategies frozen for the iteration, an entry's utility does
+        # not depend on how it is reached and its regret and strategy updates
+        # are linear in its reach. So every entry is walked once, with the
+        # reach of all its occurrences summed: first top-down to sum the reach
+        # of the nested entries, then bottom-up to update and cache utilities.
+        tree = self.tree
+        terminal, _, infostates, first_child, _ = tree.get_node_lists()
+        entry, owners = tree.get_transpositions()
+        strategies = [rm.get_next_strategy() for rm in self.regret_minimizers]
+        roots = tree.roots.tolist()
+
+        entry_reach = [0] * len(owners)
+        for root in roots:
+            entry_reach[entry[root]] += 1
+        lookups = len(roots)
+        stack = []
+        for e, owner in enumerate(owners):
+            stack.append((owner, entry_reach[e]))
+            while stack:
+                node, reach = stack.pop()
+                for j, p in enumerate(strategies[infostates[node]].tolist()):
+                    child = first_child[node] + j
+                    if entry[child] >= 0:
+                        entry_reach[entry[child]] += reach * p
+                        lookups += 1
+                    elif terminal[child] < 0:
+                        stack.append((child, reach * p))
+
+        entry_utility = [None] * len(owners)
+        for e in reversed(range(len(owners))):
+            entry_utility[e] = self.walk_stack(owners[e], entry_reach[e], strategies,
+                                               entry_utility)[0].copy()
+        self.transposition_hits += lookups - len(owners)
+        self.transposition_misses += len(owners)
+        return [entry_utility[entry[root]] for root in roots]
+
+    def get_transposition_stats(self):
+        lookups = self.transposition_hits + self.transposition_misses
+        return {"hits": self.transposition_hits, "misses": self.transposition_misses,
+                "size": len(self.get_tree().get_transpositions()[1]),
+                "hit_rate": self.transposition_hits / lookups if lookups else 0}
 
     def get_overall_regret(self):
-        overall_regret = [0] * self.game.get_num_players()
-        for i in self.regret_minimizers:
-            rm = self.regret_minimizers[i]
-            regret = rm.get_average_regret(self.t)
-            overall_regret[i[0]] += max(0, regret)
-        return overall_regret
-
-    def get_regret_table(self):
+        return (self.store.regret_total / self.variant.get_regret_norm(self.t)).tolist()
+
+    def get_regret_columns(self):
         colnames = ["Iteration", "Player 1", "Player 2"]
         if self.game.num_players == 3:
             colnames += ["Player 3"]
-        return pd.DataFrame(self.regret_table, columns=colnames)
-
-    def get_strategy_list(self):
-        return self.strategy_list
-
-    def training_iteration(self, update_rate):
-        self.t += 1
-        for state in self.game.get_all_start_states():
-            self.game.reset(start_state=state)
-            self.walk_trees()
-        regret = self.get_overall_regret()
-        if self.t % update_rate == 0:
-            self.regret_table += [[self.t] + regret]
-            self.strategy_list += [self.get_average_strategies()]
-        return regret
-
-    def train(self, iterations=1, epsilon=np.inf, update_rate=1):
-        self.t = 0
-        num_players = self.game.get_num_players()
-
-        regret = self.training_iteration(update_rate)
-        equilibrium = [r < epsilon / num_players for r in regret]
-
-        while self.t < iterations or not all(equilibrium):
-            regret = self.training_iteration(update_rate)
-            equilibrium = [r < epsilon / num_players for r in regret]
-
-        return self.t
+        return colnames
 
+    def get_regret_row(self, regret):
+        return regret
 
+    def get_regret_scale(self, regret):
+        return max(regret) * self.game.get_num_players()
 
+    def is_converged(self, regret, epsilon):
+        num_players = self.game.get_num_players()
+        return all(r < epsilon / num_players for r in regret)
+
+    def check_terminal_hooks(self):
+        if self.transpositions:
+            raise ValueError("Terminal hooks need every terminal visited, which "
+                             "transpositions skip.")
+
+    def check_pool(self):
+        if self.transpositions:
+            raise ValueError("Transpositions share subtrees across start states and do "
+                             "not run in a process pool.")
+
+    def walk_roots(self):
+        if not self.transpositions:
+            return super().walk_roots()
+        for root, utility in zip(self.get_tree().roots, self.walk_transpositions()):
+            self.instrumentation.end_traversal(self, root, utility)
@@ -0,0 +1,143 @@
+import copy
+import numpy as np
+
+from cfr import CFR, RegretMinimizer
+from exploitability import get_exploitability
+from regret_store import AverageStrategies, RegretStore
+
+
+def get_batch_payoffs(tree, costs, edge_ids=None):
+    # Player paths of every terminal as flat (terminal, player, edge) triples.
+    # Games with named edges pass edge_ids to map them to cost rows.
+    terminals, players, edges = [], [], []
+    for t, paths in enumerate(tree.outcomes):
+        for i, path in enumerate(paths):
+            terminals.extend([t] * len(path))
+            players.extend([i] * len(path))
+            edges.extend(path if edge_ids is None else [edge_ids[e] for e in path])
+    terminals = np.asarray(terminals, dtype=np.int64)
+    players = np.asarray(players, dtype=np.int64)
+    edges = np.asarray(edges, dtype=np.int64)
+
+    num_terminals = len(tree.outcomes)
+    pairs, inverse, congestion = np.unique(terminals * costs.shape[1] + edges,
+                                           return_inverse=True, return_counts=True)
+
+    player_costs = np.zeros((len(costs), num_terminals, tree.num_players))
+    np.add.at(player_costs, (slice(None), terminals, players),
+              costs[:, edges, congestion[inverse] - 1])
+    utility = -player_costs
+    utility -= utility.mean(axis=2, keepdims=True)
+
+    potential = np.zeros((len(costs), num_terminals))
+    np.add.at(potential, (slice(None), pairs // costs.shape[1]),
+              -np.cumsum(costs, axis=2)[:, pairs % costs.shape[1], congestion - 1])
+    return utility, potential
+
+
+class BatchedRegretMinimizer(RegretMinimizer):
+    # Strategies and action utilities are action-major, (actions, batch, ...),
+    # so that CFR's traversals index an action's batch column as they would
+    # index a single value.
+    def get_next_strategy(self):
+        positive_regrets = np.maximum(self.regret_sum, 0)
+        total = positive_regrets.sum(axis=1, keepdims=True)
+        strategy = np.where(total > 0, positive_regrets / np.where(total > 0, total, 1),
+                            1 / self.num_actions)
+        return strategy.T[:, :, None]
+
+    def update_regret(self, player, reach, weight=1):
+        imm_regret = (self.action_util[:, :, player].T - self.infostate_util[:, player, None]) \
+            * np.reshape(reach, (-1, 1)) * weight
+        self.add_regret(imm_regret)
+
+    def add_regret(self, regret):
+        self.regret_sum += regret
+        self.store.set_batch_max_regret(self.index, self.regret_sum.max(axis=1))
+
+    def update_strategy_sum(self, strategy, reach, weight):
+        reach = np.reshape(reach, (-1, 1))
+        self.strategy_sum += strategy[:, :, 0].T * reach * weight
+        self.reach_sum += reach * weight
+
+
+class BatchedCFR(CFR):
+    def __init__(self, game, costs, metrics_prefix=None, buffer_size=1024,
+                 variant="vanilla", snapshot_encoding="dense", seed=None):
+        costs = np.asarray(costs, dtype=float)
+        num_players = game.get_num_players()
+        if costs.ndim != 3 or costs.shape[1] != len(game.costs) \
+                or costs.shape[2] < num_players:
+            raise ValueError("Costs need shape (configurations, %d edges, %d players)."
+                             % (len(game.costs), num_players))
+
+        self.costs = costs
+        self.edge_ids = {edge: i for i, edge in enumerate(game.costs)} \
+            if isinstance(game.costs, dict) else None
+        self.batch_size = len(costs)
+        self.utility = None
+        self.terminal_utility = None
+        self.potential = None
+
+        super().__init__(game, metrics_prefix, buffer_size, variant, snapshot_encoding, seed)
+        self.store = RegretStore((num_players,), num_owners=num_players,
+                                 batch_shape=(self.batch_size,))
+        self.average_strategies = AverageStrategies(self.registry, self.store,
+                                                    self.average_strategies.group_key)
+
+    def get_tree(self):
+        tree = super().get_tree()
+        if self.utility is None:
+            self.utility, self.potential = get_batch_payoffs(tree, self.costs,
+                                                             self.edge_ids)
+            self.terminal_utility = np.moveaxis(self.utility, 1, 0)
+            if self.game.normalize_potential:
+                self.potential -= self.potential.max(axis=1, keepdims=True)
+        return tree
+
+    def add_regret_minimizers(self):
+        num_players = self.game.get_num_players()
+        for i in range(len(self.regret_minimizers), len(self.registry)):
+            self.regret_minimizers.append(
+                BatchedRegretMinimizer(self.registry.actions[i], num_players,
+                                       self.store, self.registry.players[i]))
+
+    def get_terminal_utility(self):
+        return self.terminal_utility
+
+    def get_average_strategies(self):
+        average_strategies = self.average_strategies
+        avg_strategies = average_strategies.get_average()
+        return {(k, key): dict(zip(actions, avg_strategies[k, g]))
+                for k in range(self.batch_size)
+                for g, (key, actions) in enumerate(zip(average_strategies.keys,
+                                                       average_strategies.actions))}
+
+    def get_config_strategies(self, config):
+        return {key: strategy for (k, key), strategy in self.get_average_strategies().items()
+                if k == config}
+
+    def get_config_tree(self, config):
+        tree = copy.copy(self.get_tree())
+        tree.utility = self.utility[config]
+        tree.potential = self.potential[config]
+        return tree
+
+    def get_overall_regret(self):
+        regret = self.store.regret_total / self.variant.get_regret_norm(self.t)
+        return regret.T.ravel().tolist()
+
+    def get_regret_columns(self):
+        return ["Iteration"] + ["Config %d Player %d" % (k + 1, i + 1)
+                                for k in range(self.batch_size)
+                                for i in range(self.game.get_num_players())]
+
+    def get_exploitability(self, config=None):
+        if config is not None:
+            return get_exploitability(self.get_config_tree(config),
+                                      self.get_config_strategies(config))
+        return max(self.get_exploitability(k) for k in range(self.batch_size))
+
+    def check_pool(self):
+        raise ValueError("BatchedCFR already shares one traversal across the batch "
+                         "and does not run in a process pool.")
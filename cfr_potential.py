@@ -1,157 +1,243 @@
 import numpy as np
-import pandas as pd
 
-from random import choices
+from regret_store import RegretStore
+from solver import Solver
 
 
 class PotentialRegretMinimizer:
-    def __init__(self, actions):
-        self.num_actions = len(actions)
-        self.regret_sum = {a: 1 for a in actions}
+    def __init__(self, actions, store=None):
+        self.actions = list(actions)
+        self.num_actions = len(self.actions)
 
-        self.strategy_sum = {a: 0 for a in actions}
-        self.reach_sum = 0
-
-        self.action_util: dict[float] = {}
+        self.store = store if store is not None else RegretStore(initial_regret=1)
+        self.index = self.store.add(self)
         self.infostate_util = 0
 
     def reset_utilities(self):
-        self.action_util: dict[float] = {}
+        self.action_util.fill(0)
         self.infostate_util = 0
 
     def get_next_strategy(self):
-        positive_regrets = {a: max(self.regret_sum[a], 0)
-                            for a in self.regret_sum}
-        total = sum(positive_regrets.values())
-        return {a: (positive_regrets[a] / total)
-                if total > 0 else (1 / self.num_actions)
-                for a in self.regret_sum}
-
-    def update_regrets(self, action, reach):
+        positive_regrets = np.maximum(self.regret_sum, 0)
+        total = positive_regrets.sum()
+        if total > 0:
+            return positive_regrets / total
+        return np.full(self.num_actions, 1 / self.num_actions)
+
+    def update_regrets(self, action, reach, weight=1):
         imm_regret = (self.action_util[action] - self.infostate_util)
-        self.regret_sum[action] += imm_regret * reach
+        self.regret_sum[action] += imm_regret * reach * weight
+        self.store.set_max_regret(self.index, self.regret_sum.max())
 
-    def update_strategy_sum(self, strategy, reach, t):
-        for a in strategy:
-            self.strategy_sum[a] += strategy[a] * reach * t
-        self.reach_sum += reach * t
+    def update_strategy_sum(self, strategy, reach, weight):
+        self.strategy_sum += strategy * reach * weight
+        self.reach_sum += reach * weight
 
     def get_average_strategy(self):
-        return {a: (self.strategy_sum[a] / self.reach_sum)
-                if self.reach_sum > 0 else (1 / self.num_actions)
-                for a in self.strategy_sum}
+        if self.reach_sum[0] > 0:
+            avg_strategy = self.strategy_sum / self.reach_sum[0]
+        else:
+            avg_strategy = np.full(self.num_actions, 1 / self.num_actions)
+        return dict(zip(self.actions, avg_strategy))
 
     def get_average_regret(self, t):
-        return max(self.regret_sum.values()) / t if self.num_actions > 0 else 0
-
-
-class PotentialCFR:
-    def __init__(self, game):
-        self.game = game
-        self.regret_minimizers = {}
-        self.t = 1
-        self.regret_table = []
-        self.strategy_list = []
-        self.all_strategies = [1] * game.get_num_players()
-        self.last_time = [""] * game.get_num_players()
-
-    def walk_trees(self, reach=1, info_reach=1):
-        if self.game.is_terminal():
-            return self.game.get_potential(), reach
-
-        infostate = self.game.get_infostate()
-        actions = self.game.get_valid_actions()
-
-        player = self.game.get_next_player()
-        if (player, infostate) not in self.regret_minimizers:
-            self.regret_minimizers[(player, infostate)] = PotentialRegretMinimizer(actions)
-        rm = self.regret_minimizers[(player, infostate)]
+        return self.regret_sum.max() / t if self.num_actions > 0 else 0
+
+
+class PotentialCFR(Solver):
+    def __init__(self, game, metrics_prefix=None, buffer_size=1024, variant="vanilla",
+                 trajectories=None, snapshot_encoding="dense", seed=None):
+        super().__init__(game, RegretStore(initial_regret=1), lambda key: key[1][0],
+                         metrics_prefix, buffer_size, variant, snapshot_encoding, seed)
+        self.trajectories = trajectories
+
+    def add_regret_minimizers(self):
+        for actions in self.registry.actions[len(self.regret_minimizers):]:
+            self.regret_minimizers.append(PotentialRegretMinimizer(actions, self.store))
+
+    def walk_trees(self, node, reach=1, info_reach=1, round_reach=1):
+        tree = self.tree
+        if tree.terminal[node] >= 0:
+            return tree.potential[tree.terminal[node]], reach, 1
+
+        rm = self.regret_minimizers[tree.infostate[node]]
         strategy = rm.get_next_strategy()
-        rm.update_strategy_sum(strategy, info_reach, self.t)
+        rm.update_strategy_sum(strategy, info_reach, self.strategy_weight)
 
         rm.reset_utilities()
-        action = choices(list(strategy.keys()), weights=list(strategy.values()))[0]
-
-        all_strategies = []
-        if not any(self.game.get_scheduled_actions()):
-            all_strategies = self.all_strategies.copy()
-            self.all_strategies = [1] * self.game.get_num_players()
-        new_reach = reach * strategy[action]
-        self.all_strategies[player] = strategy[action]
-        self.last_time[player] = action
-
-        self.game.take_action(action)
-        if self.game.get_next_player() <= player:
-            rm.action_util[action], action_reach = self.walk_trees(new_reach, new_reach)
-        else:
-            rm.action_util[action], action_reach = self.walk_trees(new_reach, info_reach)
-        self.game.undo_action()
+        j = self.rng.choose(strategy)
+        child = tree.first_child[node] + j
 
-        other_reach = np.prod([s for i, s in enumerate(self.all_strategies) if i != player])
-        rm.infostate_util += rm.action_util[action] * strategy[action] * other_reach
-        rm.update_regrets(action, action_reach)
+        if tree.round_start[node]:
+            round_reach = 1
+        p = strategy[j]
+        new_reach = reach * p
 
-        if not any(self.game.get_scheduled_actions()):
-            self.all_strategies = all_strategies
-            new_reach = reach
-            utility = rm.infostate_util
+        if tree.round_start[child]:
+            rm.action_util[j], action_reach, tail_reach = \
+                self.walk_trees(child, new_reach, new_reach)
         else:
-            new_reach = action_reach
-            utility = rm.action_util[action]
+            rm.action_util[j], action_reach, tail_reach = \
+                self.walk_trees(child, new_reach, info_reach, round_reach * p)
+
+        rm.infostate_util += rm.action_util[j] * p * (round_reach * tail_reach)
+        rm.update_regrets(j, action_reach, self.regret_weight)
+
+        if tree.round_start[node]:
+            return rm.infostate_util, reach, 1
+        return rm.action_util[j], action_reach, p * tail_reach
+
+    def walk_stack(self, root):
+        # Same traversal as walk_trees: frames are pushed down the sampled
+        # path and popped to apply the updates bottom up.
+        tree = self.tree
+        terminal, _, infostates, first_child, round_start = tree.get_node_lists()
+        minimizers = self.regret_minimizers
+        strategy_weight = self.strategy_weight
+        rng = self.rng
+        frames = self.frames
+
+        depth = 0
+        node, reach, info_reach, round_reach = root, 1, 1, 1
+        while terminal[node] < 0:
+            rm = minimizers[infostates[node]]
+            strategy = rm.get_next_strategy()
+            rm.update_strategy_sum(strategy, info_reach, strategy_weight)
+            # Only the sampled action's utility is written and read.
+            rm.infostate_util = 0
+            j = rng.choose(strategy)
+
+            if round_start[node]:
+                round_reach = 1
+            p = strategy[j]
+            if depth == len(frames):
+                frames.append([None] * 6)
+            frame = frames[depth]
+            frame[0], frame[1], frame[2], frame[3], frame[4], frame[5] = \
+                node, rm, j, p, reach, round_reach
+            depth += 1
+
+            node = first_child[node] + j
+            reach = reach * p
+            if round_start[node]:
+                info_reach = reach
+            round_reach = round_reach * p
+
+        self.instrumentation.count("nodes_visited", depth + 1)
+        self.instrumentation.count("terminals_evaluated")
+
+        utility = tree.potential[terminal[node]]
+        action_reach, tail_reach = reach, 1
+        regret_weight = self.regret_weight
+        for depth in range(depth - 1, -1, -1):
+            node, rm, j, p, reach, round_reach = frames[depth]
+            rm.action_util[j] = utility
+            rm.infostate_util += rm.action_util[j] * p * (round_reach * tail_reach)
+            rm.update_regrets(j, action_reach, regret_weight)
+
+            if round_start[node]:
+                utility, action_reach, tail_reach = rm.infostate_util, reach, 1
+            else:
+                utility, tail_reach = rm.action_util[j], p * tail_reach
+        return utility, action_reach, tail_reach
+
+    def sample_trajectories(self):
+        # Samples self.trajectories paths from every start state at once with
+        # the strategies frozen at the start of the iteration. The backward
+        # pass reproduces walk_trees' bookkeeping for each path, and the
+        # updates are averaged over the paths of a start state.
+        tree = self.get_tree()
+        store = self.store
+        size = store.size
+
+        positive_regrets = np.maximum(store.regret_sum[:size], 0)
+        total = positive_regrets.sum(axis=1, keepdims=True)
+        uniform = store.mask[:size] / np.maximum(store.num_actions[:size, None], 1)
+        strategies = np.where(total > 0, positive_regrets / np.where(total > 0, total, 1),
+                              uniform)
+        cumulative = np.cumsum(strategies, axis=1)
+
+        node = np.repeat(tree.roots, self.trajectories)
+        reach = np.ones(len(node))
+        info_reach = np.ones(len(node))
+        prefix = np.ones(len(node))
+        alive = tree.terminal[node] < 0
+
+        steps = []
+        while alive.any():
+            idx = np.flatnonzero(alive)
+            parent = node[idx]
+            infostate = tree.infostate[parent]
+            start = tree.round_start[parent]
+
+            draws = self.rng.generator.random(len(idx)) * cumulative[infostate, -1]
+            j = np.minimum((cumulative[infostate] <= draws[:, None]).sum(axis=1),
+                           tree.num_children[parent] - 1)
+            sigma = strategies[infostate, j]
+
+            info_reach[idx] = np.where(start, reach[idx], info_reach[idx])
+            prefix[idx] = np.where(start, 1, prefix[idx])
+            steps.append((idx, infostate, j, sigma, start, reach[idx], info_reach[idx],
+                          prefix[idx]))
+
+            reach[idx] *= sigma
+            prefix[idx] *= sigma
+            node[idx] = tree.first_child[parent] + j
+            alive[idx] = tree.terminal[node[idx]] < 0
+
+        weight = 1 / self.trajectories
+        regret_weight = self.regret_weight * weight
+        strategy_weight = self.strategy_weight * weight
+
+        child_util = tree.potential[tree.terminal[node]]
+        child_reach = reach
+        tail = np.ones(len(node))
+        for idx, infostate, j, sigma, start, node_reach, node_info_reach, node_prefix \
+                in reversed(steps):
+            action_util = child_util[idx]
+            action_reach = child_reach[idx]
+            infostate_util = action_util * sigma * node_prefix * tail[idx]
+
+            np.add.at(store.regret_sum, (infostate, j),
+                      (action_util - infostate_util) * action_reach * regret_weight)
+            np.add.at(store.strategy_sum, infostate,
+                      strategies[infostate] * (node_info_reach * strategy_weight)[:, None])
+            np.add.at(store.reach_sum, infostate, node_info_reach * strategy_weight)
+
+            child_util[idx] = np.where(start, infostate_util, action_util)
+            child_reach[idx] = np.where(start, node_reach, action_reach)
+            tail[idx] = np.where(start, 1, sigma * tail[idx])
+
+        store.refresh_max_regrets()
+        self.instrumentation.count("nodes_visited", len(node) + sum(len(s[0]) for s in steps))
+        self.instrumentation.count("terminals_evaluated", len(node))
 
-        return utility, new_reach
+    def get_overall_regret(self):
+        return float(self.store.regret_total[0] / self.variant.get_regret_norm(self.t))
 
-    def get_average_strategies(self):
-        avg_strategies = {}
-        info_hits = {}
-        for i in self.regret_minimizers:
-            rm = self.regret_minimizers[i]
-            avg_strategy = rm.get_average_strategy()
+    def get_regret_columns(self):
+        return ["Iteration", "Regret"]
 
-            if i[1][0] not in avg_strategies:
-                avg_strategies[i[1][0]] = {a: avg_strategy[a] for a in avg_strategy}
-                info_hits[i[1][0]] = 1
-            else:
-                for j in avg_strategies[i[1][0]]:
-                    avg_strategies[i[1][0]][j] = (info_hits[i[1][0]] * avg_strategies[i[1][0]][j] + avg_strategy[j]) / \
-                                                 (info_hits[i[1][0]] + 1)
-                info_hits[i[1][0]] += 1
-        return avg_strategies
+    def get_regret_row(self, regret):
+        return [regret]
 
-    def get_overall_regret(self):
-        overall_regret = 0
-        for i in self.regret_minimizers:
-            rm = self.regret_minimizers[i]
-            regret = rm.get_average_regret(self.t)
-            overall_regret += max(0, regret)
-        return overall_regret
-
-    def get_regret_table(self):
-        colnames = ["Iteration", "Regret"]
-        return pd.DataFrame(self.regret_table, columns=colnames)
-
-    def get_strategy_list(self):
-        return self.strategy_list
-
-    def training_iteration(self, update_rate):
-        self.t += 1
-        for state in self.game.get_all_start_states():
-            self.game.reset(start_state=state)
-            self.walk_trees()
-        regret = self.get_overall_regret()
-        if self.t % update_rate == 0:
-            self.regret_table += [[self.t, regret]]
-            self.strategy_list += [self.get_average_strategies()]
+    def get_regret_scale(self, regret):
         return regret
 
-    def train(self, iterations=1, epsilon=np.inf, update_rate=1):
-        self.t = 0
-        num_players = self.game.get_num_players()
-
-        regret = self.training_iteration(update_rate)
-        while self.t < iterations or regret > epsilon:
-            regret = self.training_iteration(update_rate)
+    def is_converged(self, regret, epsilon):
+        return regret <= epsilon
 
-        return self.t
+    def check_terminal_hooks(self):
+        if self.trajectories is not None:
+            raise ValueError("Terminal hooks need the tree walked node by node, "
+                             "which trajectory sampling does not do.")
 
+    def check_pool(self):
+        if self.trajectories is not None:
+            raise ValueError("Trajectory sampling is vectorised already and does not run "
+                             "in a process pool.")
 
+    def walk_roots(self):
+        if self.trajectories is None:
+            return super().walk_roots()
+        self.sample_trajectories()
@@ -0,0 +1,144 @@
+import numpy as np
+
+from cfr import CFR
+
+
+SAMPLING = ("external", "outcome")
+
+
+class MCCFR(CFR):
+    compiled = False
+
+    def __init__(self, game, metrics_prefix=None, buffer_size=1024, variant="vanilla",
+                 sampling="external", exploration=0.6, snapshot_encoding="dense",
+                 seed=None):
+        if sampling not in SAMPLING:
+            raise ValueError("Unknown sampling scheme %r, expected one of %s."
+                             % (sampling, ", ".join(SAMPLING)))
+
+        super().__init__(game, metrics_prefix, buffer_size, variant, snapshot_encoding, seed)
+        self.sampling = sampling
+        self.exploration = exploration
+        self.start_states = game.get_all_start_states()
+
+    def get_regret_minimizer(self):
+        game = self.game
+        index = self.registry.intern(game.get_next_player(), game.get_infostate(),
+                                     game.get_valid_actions())
+        if index >= len(self.regret_minimizers):
+            self.add_regret_minimizers()
+        return self.regret_minimizers[index]
+
+    # MCCFR samples textbook counterfactual regret: the acting player's
+    # action values weighted by the other players' reach. This is not the
+    # round-threaded regret CFR.walk_trees accumulates, so the two converge
+    # to the same equilibria but their regret tables are not comparable.
+    # Both walks keep the path on an explicit stack, like CFR.walk_stack, so
+    # long games don't hit the recursion limit.
+
+    def walk_external(self, player, weight):
+        game = self.game
+        instrumentation = self.instrumentation
+        # One frame per decision on the path: [rm, strategy, action values,
+        # action index]. Other players' frames have no action values.
+        stack = []
+        while True:
+            instrumentation.count("nodes_visited")
+            if game.is_terminal():
+                instrumentation.count("terminals_evaluated")
+                value = game.get_utility()[player]
+            else:
+                rm = self.get_regret_minimizer()
+                strategy = rm.get_next_strategy()
+                if game.get_next_player() != player:
+                    rm.update_strategy_sum(strategy, weight, self.strategy_weight)
+                    j = self.rng.choose(strategy)
+                    stack.append([rm, strategy, None, j])
+                else:
+                    j = 0
+                    stack.append([rm, strategy, np.zeros(rm.num_actions), j])
+                game.take_action(rm.actions[j])
+                continue
+
+            while stack:
+                game.undo_action()
+                frame = stack[-1]
+                rm, strategy, action_values, j = frame
+                if action_values is None:
+                    stack.pop()
+                    continue
+                action_values[j] = value
+                if j + 1 < rm.num_actions:
+                    frame[3] = j + 1
+                    game.take_action(rm.actions[j + 1])
+                    break
+                stack.pop()
+                value = strategy @ action_values
+                rm.add_regret((action_values - value) * weight * self.regret_weight)
+            else:
+                return value
+
+    def walk_outcome(self, player, other_reach, sample_reach):
+        game = self.game
+        instrumentation = self.instrumentation
+        # Outcome sampling follows a single path down and updates it back up.
+        path = []
+        while True:
+            instrumentation.count("nodes_visited")
+            if game.is_terminal():
+                instrumentation.count("terminals_evaluated")
+                break
+
+            rm = self.get_regret_minimizer()
+            strategy = rm.get_next_strategy()
+            acting = game.get_next_player() == player
+
+            probs = self.exploration / rm.num_actions + (1 - self.exploration) * strategy \
+                if acting else strategy
+            j = self.rng.choose(probs)
+            path.append((rm, strategy, j, acting, other_reach, sample_reach))
+
+            game.take_action(rm.actions[j])
+            if not acting:
+                other_reach = other_reach * strategy[j]
+            sample_reach = sample_reach * probs[j]
+
+        utility, tail_reach = game.get_utility()[player] / sample_reach, 1
+        for rm, strategy, j, acting, other_reach, sample_reach in reversed(path):
+            game.undo_action()
+            if acting:
+                value = utility * other_reach * tail_reach
+                regret = np.full(rm.num_actions, -value * strategy[j])
+                regret[j] += value
+                rm.add_regret(regret * self.regret_weight)
+            else:
+                rm.update_strategy_sum(strategy, other_reach / sample_reach,
+                                       self.strategy_weight)
+            tail_reach = tail_reach * strategy[j]
+
+        return utility, tail_reach
+
+    def traverse(self, player):
+        # Start states are sampled uniformly and weighted by their number, so
+        # the sampled regrets estimate the sum over all start states.
+        start_state = self.rng.choice(self.start_states)
+        self.game.reset(start_state=start_state)
+        weight = len(self.start_states)
+
+        if self.sampling == "external":
+            utility = self.walk_external(player, weight)
+        else:
+            utility, _ = self.walk_outcome(player, 1, 1 / weight)
+        self.instrumentation.end_traversal(self, start_state, utility)
+
+    def walk_roots(self):
+        for player in range(self.game.get_num_players()):
+            self.traverse(player)
+
+    def check_terminal_hooks(self):
+        raise ValueError("Terminal hooks are called with compiled tree nodes, "
+                         "which MCCFR does not walk.")
+
+    def check_pool(self):
+        raise ValueError("MCCFR samples the live game and does not run in a "
+                         "process pool.")
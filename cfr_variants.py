@@ -0,0 +1,88 @@
+import numpy as np
+
+
+class Vanilla:
+    name = "vanilla"
+
+    def __repr__(self):
+        return "%s()" % type(self).__name__
+
+    def get_weights(self, t):
+        # Weights of this iteration's regrets and strategies.
+        return 1, t
+
+    def get_regret_norm(self, t):
+        return t
+
+    def end_iteration(self, store, t):
+        pass
+
+
+class CFRPlus(Vanilla):
+    name = "cfr+"
+
+    def end_iteration(self, store, t):
+        regret_sum = store.regret_sum[..., :store.size, :]
+        np.maximum(regret_sum, 0, out=regret_sum)
+        store.refresh_max_regrets()
+
+
+class LinearCFR(Vanilla):
+    name = "linear"
+
+    def get_weights(self, t):
+        return t, t
+
+    def get_regret_norm(self, t):
+        return t * (t + 1) / 2
+
+
+class DCFR(Vanilla):
+    name = "dcfr"
+
+    def __init__(self, alpha=1.5, beta=0, gamma=2):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.norm_t = 0
+        self.norm = 0.0
+
+    def __repr__(self):
+        return "DCFR(alpha=%r, beta=%r, gamma=%r)" % (self.alpha, self.beta, self.gamma)
+
+    def get_weights(self, t):
+        return 1, 1
+
+    def get_discounts(self, t):
+        positive = t ** self.alpha / (t ** self.alpha + 1)
+        negative = t ** self.beta / (t ** self.beta + 1)
+        return positive, negative, (t / (t + 1)) ** self.gamma
+
+    def get_regret_norm(self, t):
+        if t < self.norm_t:
+            self.norm_t, self.norm = 0, 0.0
+        while self.norm_t < t:
+            self.norm_t += 1
+            self.norm = (self.norm + 1) * self.get_discounts(self.norm_t)[0]
+        return self.norm
+
+    def end_iteration(self, store, t):
+        positive, negative, strategy = self.get_discounts(t)
+        size = store.size
+        regret_sum = store.regret_sum[..., :size, :]
+        regret_sum *= np.where(regret_sum > 0, positive, negative)
+        store.strategy_sum[..., :size, :] *= strategy
+        store.reach_sum[..., :size] *= strategy
+        store.refresh_max_regrets()
+
+
+VARIANTS = {v.name: v for v in (Vanilla, CFRPlus, LinearCFR, DCFR)}
+
+
+def get_variant(variant):
+    if isinstance(variant, str):
+        if variant not in VARIANTS:
+            raise ValueError("Unknown CFR variant %r, expected one of %s."
+                             % (variant, ", ".join(VARIANTS)))
+        return VARIANTS[variant]()
+    return variant
@@ -0,0 +1,141 @@
+import os
+import threading
+import numpy as np
+
+from ast import literal_eval
+
+from infostate_registry import InfostateRegistry
+from metrics import StrategyHistory
+
+
+def get_state(solver):
+    registry = solver.registry
+    store = solver.store
+    size = store.size
+    if solver.metrics is not None:
+        solver.metrics.flush()
+
+    strategy_list = solver.strategy_list
+    return {"variant": repr(solver.variant),
+            "t": solver.t,
+            "exploitability": solver.exploitability,
+            "keys": np.array([repr(k) for k in registry.keys], dtype=str),
+            "actions": np.array([repr(a) for a in registry.actions], dtype=str),
+            "regret_sum": store.regret_sum[..., :size, :].copy(),
+            "strategy_sum": store.strategy_sum[..., :size, :].copy(),
+            "reach_sum": store.reach_sum[..., :size].copy(),
+            "max_regret": store.max_regret[..., :size].copy(),
+            "regret_total": store.regret_total.copy(),
+            "regret_table": np.array(solver.regret_table, dtype=float).reshape(
+                (-1, len(solver.get_regret_columns()))),
+            "exploitability_table": np.array(solver.exploitability_table,
+                                             dtype=float).reshape((-1, 2)),
+            "strategy_columns": np.array([repr(c) for c in strategy_list.layout], dtype=str),
+            "strategy_rows": strategy_list.get_rows(),
+            "metrics_rows": len(solver.metrics.regrets) if solver.metrics is not None else -1,
+            "rng_state": np.array(solver.rng.get_state()[0]),
+            "rng_block": solver.rng.get_state()[1]}
+
+
+def set_state(solver, state):
+    if str(state["variant"]) != repr(solver.variant):
+        raise ValueError("Checkpoint was written by %s, not %r."
+                         % (state["variant"], solver.variant))
+
+    store = solver.store
+    if state["regret_sum"].shape[:-2] != store.regret_sum.shape[:-2] \
+            or state["regret_table"].shape[1] != len(solver.get_regret_columns()):
+        raise ValueError("Checkpoint was written by a different kind of solver.")
+
+    # Solvers that compile the game must have exactly the checkpoint's
+    # infostates. MCCFR discovers them while sampling, so it only has to
+    # agree on those it already knows, and interns the rest in checkpoint
+    # order so that they line up with the saved arrays.
+    keys = state["keys"].tolist()
+    saved = InfostateRegistry()
+    for key, actions in zip(keys, state["actions"].tolist()):
+        saved.intern(*literal_eval(key), literal_eval(actions))
+    registry = solver.registry
+    if solver.compiled:
+        solver.get_tree()
+    known = len(registry)
+    if len(saved) != len(keys) or known > len(saved) \
+            or (solver.compiled and known != len(saved)) \
+            or saved.keys[:known] != registry.keys or saved.actions[:known] != registry.actions:
+        raise ValueError("Checkpoint does not match the infostates of this game.")
+    for i in range(known, len(saved)):
+        registry.intern(*saved.keys[i], saved.actions[i])
+    solver.add_regret_minimizers()
+
+    size, width = state["regret_sum"].shape[-2:]
+    store.regret_sum[..., :size, :width] = state["regret_sum"]
+    store.strategy_sum[..., :size, :width] = state["strategy_sum"]
+    store.reach_sum[..., :size] = state["reach_sum"]
+    if "regret_total" in state:
+        store.max_regret[..., :size] = state["max_regret"]
+        store.regret_total[...] = state["regret_total"]
+    else:
+        store.refresh_max_regrets()
+
+    solver.t = int(state["t"])
+    solver.exploitability = float(state["exploitability"])
+    solver.regret_table = [[int(row[0])] + row[1:]
+                           for row in state["regret_table"].tolist()]
+    solver.exploitability_table = [[int(t), e]
+                                   for t, e in state["exploitability_table"].tolist()]
+    strategy_list = StrategyHistory(solver.strategy_list.encoding,
+                                    solver.strategy_list.keyframe_rate)
+    layout = [literal_eval(c) for c in state["strategy_columns"].tolist()]
+    for row in state["strategy_rows"]:
+        strategy_list.append(layout, row)
+    solver.strategy_list = strategy_list
+
+    metrics_rows = int(state["metrics_rows"])
+    if solver.metrics is not None and metrics_rows >= 0:
+        solver.metrics.resume(metrics_rows)
+
+    if "rng_state" in state:
+        solver.rng.set_state(literal_eval(str(state["rng_state"])), state["rng_block"])
+
+
+def write_state(path, state):
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(f, **state)
+    os.replace(temp_path, path)
+
+
+def read_state(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+class CheckpointWriter:
+    def __init__(self, path, checkpoint_rate):
+        self.path = path
+        self.checkpoint_rate = checkpoint_rate
+        self.thread = None
+        self.error = None
+
+    def track(self, solver):
+        if self.checkpoint_rate and solver.t % self.checkpoint_rate == 0:
+            self.write(get_state(solver))
+
+    def write(self, state):
+        self.wait()
+        self.thread = threading.Thread(target=self.run, args=(state,), daemon=True)
+        self.thread.start()
+
+    def run(self, state):
+        try:
+            write_state(self.path, state)
+        except Exception as e:
+            self.error = e
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
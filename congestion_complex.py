@@ -1,6 +1,8 @@
-from random import sample
 from itertools import permutations
 
+from payoff_cache import PayoffCache
+from random_stream import RandomStream
+
 
 COSTS_2P = {"AF": [2, 2], "AD": [0, 0], "BD": [0, 0], "BE": [0, 0], "CE": [0, 0],
             "DF": [0, 2], "EF": [0, 3], "CF": [2, 2]}
@@ -14,7 +16,9 @@ START_NODES = ["A", "B", "C"]
 
 
 class ComplexCongestionGame:
-    def __init__(self, num_players, with_information=False):
+    normalize_potential = False
+
+    def __init__(self, num_players, with_information=False, cache_size=4096, seed=None):
         if num_players < 2 or num_players >= 4:
             raise ValueError("Simple Congestion Game is only defined for 2 or 3 "
                              "player games.")
@@ -22,32 +26,46 @@ class ComplexCongestionGame:
         self.num_players = int(num_players)
         self.with_information = with_information
 
-        self.player = 0
-        self.scheduled_actions = [""] * num_players
+        self.costs = COSTS_3P if self.num_players == 3 else COSTS_2P
+        self.terminal = TERMINAL_3P if self.num_players == 3 else TERMINAL_2P
+        self.outgoing = {}
+        for c in self.costs:
+            self.outgoing.setdefault(c[0], []).append(c)
 
-        self.player_positions = list(sample(START_NODES, self.num_players)) \
-                            if num_players == 2 else START_NODES
-        self.action_history = []
-        self.player_history = []
-        self.actions_made = []
+        self.utility_cache = PayoffCache(cache_size)
+        self.potential_cache = PayoffCache(cache_size)
+        self.rng = RandomStream(seed)
+
+        self.reset()
 
     def reset(self, start_state=None):
         num_players = self.num_players
         self.player_positions = list(start_state) if start_state is not None \
-                                 else (sample(START_NODES, num_players)
-                                       if num_players == 2 else START_NODES)
+                                 else (self.rng.sample(START_NODES, num_players)
+                                       if num_players == 2 else list(START_NODES))
         self.scheduled_actions = [""] * num_players
 
         self.player = 0
         self.action_history = []
+        self.player_history = []
         self.actions_made = []
 
+        self.congestion = {c: 0 for c in self.costs}
+        self.edge_players = {c: [] for c in self.costs}
+        self.player_costs = [0] * num_players
+        self.player_paths = [[] for _ in range(num_players)]
+        self.potential = 0
+
+        self.occupancy = {}
+        for pos in self.player_positions:
+            self.occupancy[pos] = self.occupancy.get(pos, 0) + 1
+        self.finished = self.occupancy.get(self.terminal, 0)
+
     def get_num_players(self):
         return self.num_players
 
     def get_accompanying(self):
-        return sum(pos == self.player_positions
-                   for pos in self.player_positions) - 1
+        return self.occupancy[self.player_positions[self.player]] - 1
 
     def get_infostate(self):
         return self.player_positions[self.player], \
@@ -57,79 +75,122 @@ class ComplexCongestionGame:
         return list(permutations(START_NODES, self.num_players))
 
     def get_valid_actions(self):
-        costs = COSTS_3P if self.num_players == 3 else COSTS_2P
-        return [c for c in costs if c[0] == self.player_positions[self.player]]
+        return self.outgoing.get(self.player_positions[self.player], [])
 
     def get_next_player(self):
         return self.player
 
+    def get_next_active(self, player):
+        for i in range(player + 1, self.num_players):
+            if self.player_positions[i] != self.terminal:
+                return i
+        return -1
+
     def get_remaining_players(self):
-        terminal = TERMINAL_3P if self.num_players == 3 else TERMINAL_2P
         return [i for i, pos in enumerate(self.scheduled_actions) if not pos
-                and self.player_positions[i] != terminal]
+                and self.player_positions[i] != self.terminal]
 
     def is_terminal(self):
-        terminal = TERMINAL_3P if self.num_players == 3 else TERMINAL_2P
-        return all(pos == terminal for pos in self.player_positions)
+        return self.finished == self.num_players
+
+    def move(self, player, action):
+        cost = self.costs[action]
+        congestion = self.congestion[action] + 1
+        for i in self.edge_players[action]:
+            self.player_costs[i] += cost[congestion - 1] - cost[congestion - 2]
+        self.player_costs[player] += cost[congestion - 1]
+        self.edge_players[action].append(player)
+        self.player_paths[player].append(action)
+        self.congestion[action] = congestion
+        self.potential -= cost[congestion - 1]
+
+        self.occupancy[action[0]] -= 1
+        self.occupancy[action[-1]] = self.occupancy.get(action[-1], 0) + 1
+        if action[-1] == self.terminal:
+            self.finished += 1
+        self.player_positions[player] = action[-1]
+
+    def unmove(self, player, action):
+        cost = self.costs[action]
+        congestion = self.congestion[action]
+        self.potential += cost[congestion - 1]
+        self.congestion[action] = congestion - 1
+        self.edge_players[action].pop()
+        self.player_paths[player].pop()
+        self.player_costs[player] -= cost[congestion - 1]
+        for i in self.edge_players[action]:
+            self.player_costs[i] -= cost[congestion - 1] - cost[congestion - 2]
+
+        if action[-1] == self.terminal:
+            self.finished -= 1
+        self.occupancy[action[-1]] -= 1
+        self.occupancy[action[0]] += 1
+        self.player_positions[player] = action[0]
 
     def make_moves(self):
         actions_made = 0
         for i, a in enumerate(self.scheduled_actions):
             if a:
-                self.player_positions[i] = a[-1]
-                self.action_history += [a]
-                self.player_history += [i]
+                self.move(i, a)
+                self.action_history.append(a)
+                self.player_history.append(i)
+                self.scheduled_actions[i] = ""
                 actions_made += 1
-        self.scheduled_actions = [""] * self.num_players
-        self.actions_made += [actions_made]
-        remaining_players = self.get_remaining_players()
-        self.player = remaining_players[0] if remaining_players else -1
+        self.actions_made.append(actions_made)
+        self.player = self.get_next_active(-1)
 
     def take_action(self, action):
         if action in self.get_valid_actions():
             self.scheduled_actions[self.player] = action
 
-            remaining_players = self.get_remaining_players()
-            if remaining_players:
-                self.player = remaining_players[0]
+            next_player = self.get_next_active(self.player)
+            if next_player >= 0:
+                self.player = next_player
             else:
                 self.make_moves()
 
-    def undo_action(self):
-        if self.actions_made and all(not a for a in self.scheduled_actions):
-            players = self.player_history[-self.actions_made[-1]:]
-            actions = self.action_history[-self.actions_made[-1]:]
+    def get_scheduled_actions(self):
+        return self.scheduled_actions
 
-            for i in range(self.actions_made[-1]):
-                self.player_positions[players[i]] = actions[i][0]
-                self.scheduled_actions[players[i]] = actions[i]
-            self.player = players[-1]
-            self.scheduled_actions[players[-1]] = ""
+    def is_round_start(self):
+        return not any(self.scheduled_actions)
 
-            self.player_history = self.player_history[:-self.actions_made[-1]]
-            self.action_history = self.action_history[:-self.actions_made[-1]]
-            self.actions_made.pop(-1)
+    def undo_action(self):
+        if self.actions_made and not any(self.scheduled_actions):
+            last_player = self.player_history[-1]
+            for _ in range(self.actions_made.pop()):
+                player = self.player_history.pop()
+                action = self.action_history.pop()
+                self.unmove(player, action)
+                self.scheduled_actions[player] = action
+            self.player = last_player
+            self.scheduled_actions[last_player] = ""
 
         elif any(self.scheduled_actions):
             self.player = max(i for i, a in enumerate(self.scheduled_actions) if a)
             self.scheduled_actions[self.player] = ""
 
+    def get_outcome(self):
+        return tuple(map(tuple, self.player_paths))
+
+    def get_congestion_outcome(self):
+        return tuple(sorted(self.action_history))
+
+    def get_cache_stats(self):
+        return {"utility": self.utility_cache.get_stats(),
+                "potential": self.potential_cache.get_stats()}
+
+    def count_utility(self):
+        utility = [-c for c in self.player_costs]
+        average_utility = sum(utility) / self.num_players
+        zerosum_utility = [u - average_utility for u in utility]
+        return zerosum_utility
+
     def get_utility(self):
         if self.is_terminal():
-            utility = [0] * self.num_players
-            costs = COSTS_3P if self.num_players == 3 else COSTS_2P
-            congestion = {c: sum(a == c for a in self.action_history) for c in costs}
-            for i, a in enumerate(self.action_history):
-                utility[i % self.num_players] -= costs[a][congestion[a]-1]
-            average_utility = sum(utility) / self.num_players
-            zerosum_utility = [u - average_utility for u in utility]
-            return zerosum_utility
+            return list(self.utility_cache.get(self.get_outcome(), self.count_utility))
 
     def get_potential(self):
         if self.is_terminal():
-            potential = 0
-            costs = COSTS_3P if self.num_players == 3 else COSTS_2P
-            congestion = {c: sum(a == c for a in self.action_history) for c in costs}
-            for move in congestion:
-                potential -= sum(costs[move][:congestion[move]])
-            return potential
+            return self.potential_cache.get(self.get_congestion_outcome(),
+                                            lambda: self.potential)
@@ -0,0 +1,268 @@
+import numpy as np
+
+from payoff_cache import PayoffCache
+from random_stream import RandomStream
+
+
+class CongestionGame:
+    normalize_potential = False
+
+    def __init__(self, edges, costs, num_players, source, terminal,
+                 with_information=False, start_states=None, cache_size=4096,
+                 seed=None):
+        self.num_players = int(num_players)
+        self.with_information = with_information
+
+        costs = np.asarray(costs)
+        if costs.ndim != 2 or len(costs) != len(edges):
+            raise ValueError("Costs need one row of congestion costs per edge.")
+        if self.num_players < 1 or costs.shape[1] < self.num_players:
+            raise ValueError("Costs only cover congestion up to %d players."
+                             % costs.shape[1])
+
+        self.node_ids = []
+        self.node_index = {}
+        for edge in edges:
+            for node in edge:
+                if node not in self.node_index:
+                    self.node_index[node] = len(self.node_ids)
+                    self.node_ids.append(node)
+        for node in (source, terminal):
+            if node not in self.node_index:
+                raise ValueError("Node %r is not part of any edge." % (node,))
+
+        self.edges = [(self.node_index[u], self.node_index[v]) for u, v in edges]
+        if len(set(self.edges)) != len(self.edges):
+            raise ValueError("Edges must be unique.")
+        self.costs = costs
+        self.cost_table = costs[:, :self.num_players].tolist()
+        self.terminal = self.node_index[terminal]
+        self.outgoing = [[] for _ in self.node_ids]
+        for e, (u, v) in enumerate(self.edges):
+            self.outgoing[u].append(e)
+
+        self.start_states = [tuple(self.node_index[node] for node in state)
+                             for state in (start_states if start_states is not None
+                                           else [[source] * self.num_players])]
+        self.check_graph()
+
+        self.utility_cache = PayoffCache(cache_size)
+        self.potential_cache = PayoffCache(cache_size)
+        self.rng = RandomStream(seed)
+
+        self.reset()
+
+    def check_graph(self):
+        # Every reachable node has to lead to the terminal without cycles,
+        # otherwise a play never ends.
+        state = [0] * len(self.node_ids)
+        stack = [node for start in self.start_states for node in start]
+        while stack:
+            node = stack.pop()
+            if node < 0:
+                state[~node] = 2
+                continue
+            if state[node] == 2:
+                continue
+            if state[node] == 1:
+                raise ValueError("Graph has a cycle through node %r."
+                                 % (self.node_ids[node],))
+            if node != self.terminal and not self.outgoing[node]:
+                raise ValueError("Node %r cannot reach the terminal."
+                                 % (self.node_ids[node],))
+            state[node] = 1
+            stack.append(~node)
+            stack.extend(self.edges[e][1] for e in self.outgoing[node]
+                         if state[self.edges[e][1]] != 2)
+
+    def reset(self, start_state=None):
+        num_players = self.num_players
+        self.player_positions = list(start_state) if start_state is not None \
+            else list(self.rng.choice(self.start_states))
+        self.scheduled_actions = [None] * num_players
+
+        self.player = 0
+        self.action_history = []
+        self.player_history = []
+        self.actions_made = []
+
+        self.congestion = [0] * len(self.edges)
+        self.edge_players = [[] for _ in self.edges]
+        self.player_costs = [0] * num_players
+        self.player_paths = [[] for _ in range(num_players)]
+        self.potential = 0
+
+        self.occupancy = [0] * len(self.node_ids)
+        for pos in self.player_positions:
+            self.occupancy[pos] += 1
+        self.finished = self.occupancy[self.terminal]
+        if self.player_positions[0] == self.terminal:
+            self.player = self.get_next_active(0)
+
+    def get_num_players(self):
+        return self.num_players
+
+    def get_accompanying(self):
+        return self.occupancy[self.player_positions[self.player]] - 1
+
+    def get_infostate(self):
+        return self.node_ids[self.player_positions[self.player]], \
+            self.get_accompanying() if self.with_information else None
+
+    def get_all_start_states(self):
+        return list(self.start_states)
+
+    def get_valid_actions(self):
+        return self.outgoing[self.player_positions[self.player]]
+
+    def get_next_player(self):
+        return self.player
+
+    def get_next_active(self, player):
+        for i in range(player + 1, self.num_players):
+            if self.player_positions[i] != self.terminal:
+                return i
+        return -1
+
+    def get_remaining_players(self):
+        return [i for i, a in enumerate(self.scheduled_actions) if a is None
+                and self.player_positions[i] != self.terminal]
+
+    def is_terminal(self):
+        return self.finished == self.num_players
+
+    def move(self, player, action):
+        cost = self.cost_table[action]
+        congestion = self.congestion[action] + 1
+        for i in self.edge_players[action]:
+            self.player_costs[i] += cost[congestion - 1] - cost[congestion - 2]
+        self.player_costs[player] += cost[congestion - 1]
+        self.edge_players[action].append(player)
+        self.player_paths[player].append(action)
+        self.congestion[action] = congestion
+        self.potential -= cost[congestion - 1]
+
+        source, target = self.edges[action]
+        self.occupancy[source] -= 1
+        self.occupancy[target] += 1
+        if target == self.terminal:
+            self.finished += 1
+        self.player_positions[player] = target
+
+    def unmove(self, player, action):
+        cost = self.cost_table[action]
+        congestion = self.congestion[action]
+        self.potential += cost[congestion - 1]
+        self.congestion[action] = congestion - 1
+        self.edge_players[action].pop()
+        self.player_paths[player].pop()
+        self.player_costs[player] -= cost[congestion - 1]
+        for i in self.edge_players[action]:
+            self.player_costs[i] -= cost[congestion - 1] - cost[congestion - 2]
+
+        source, target = self.edges[action]
+        if target == self.terminal:
+            self.finished -= 1
+        self.occupancy[target] -= 1
+        self.occupancy[source] += 1
+        self.player_positions[player] = source
+
+    def make_moves(self):
+        actions_made = 0
+        for i, a in enumerate(self.scheduled_actions):
+            if a is not None:
+                self.move(i, a)
+                self.action_history.append(a)
+                self.player_history.append(i)
+                self.scheduled_actions[i] = None
+                actions_made += 1
+        self.actions_made.append(actions_made)
+        self.player = self.get_next_active(-1)
+
+    def take_action(self, action):
+        if action in self.get_valid_actions():
+            self.scheduled_actions[self.player] = action
+
+            next_player = self.get_next_active(self.player)
+            if next_player >= 0:
+                self.player = next_player
+            else:
+                self.make_moves()
+
+    def get_scheduled_actions(self):
+        return self.scheduled_actions
+
+    def is_round_start(self):
+        return all(a is None for a in self.scheduled_actions)
+
+    def undo_action(self):
+        if self.actions_made and self.is_round_start():
+            last_player = self.player_history[-1]
+            for _ in range(self.actions_made.pop()):
+                player = self.player_history.pop()
+                action = self.action_history.pop()
+                self.unmove(player, action)
+                self.scheduled_actions[player] = action
+            self.player = last_player
+            self.scheduled_actions[last_player] = None
+
+        elif not self.is_round_start():
+            self.player = max(i for i, a in enumerate(self.scheduled_actions)
+                              if a is not None)
+            self.scheduled_actions[self.player] = None
+
+    def get_outcome(self):
+        return tuple(map(tuple, self.player_paths))
+
+    def get_congestion_outcome(self):
+        return tuple(sorted(self.action_history))
+
+    def get_cache_stats(self):
+        return {"utility": self.utility_cache.get_stats(),
+                "potential": self.potential_cache.get_stats()}
+
+    def count_utility(self):
+        utility = [-c for c in self.player_costs]
+        average_utility = sum(utility) / self.num_players
+        zerosum_utility = [u - average_utility for u in utility]
+        return zerosum_utility
+
+    def get_utility(self):
+        if self.is_terminal():
+            return list(self.utility_cache.get(self.get_outcome(), self.count_utility))
+
+    def get_potential(self):
+        if self.is_terminal():
+            return self.potential_cache.get(self.get_congestion_outcome(),
+                                            lambda: self.potential)
+
+
+def random_congestion_game(num_nodes, num_edges, num_players, max_cost=10,
+                           with_information=False, seed=None, cache_size=4096):
+    if num_nodes < 2:
+        raise ValueError("A congestion game needs at least two nodes.")
+    max_edges = num_nodes * (num_nodes - 1) // 2
+    rng = np.random.default_rng(seed)
+
+    # Nodes are numbered in topological order from the source 0 to the
+    # terminal num_nodes - 1. Every node gets an edge in from an earlier node
+    # and an edge out to a later one, so it lies on some source-terminal path.
+    edges = set()
+    for node in range(1, num_nodes):
+        edges.add((int(rng.integers(node)), node))
+    for node in range(num_nodes - 1):
+        edges.add((node, int(rng.integers(node + 1, num_nodes))))
+    num_edges = min(max(num_edges, len(edges)), max_edges)
+    while len(edges) < num_edges:
+        u, v = sorted(rng.choice(num_nodes, 2, replace=False).tolist())
+        edges.add((u, v))
+    edges = sorted(edges)
+
+    # Costs never decrease with congestion.
+    base = rng.integers(0, max_cost + 1, size=(len(edges), 1))
+    increase = rng.integers(0, max_cost + 1, size=(len(edges), num_players - 1))
+    costs = np.cumsum(np.hstack([base, increase]), axis=1)
+
+    return CongestionGame(edges, costs, num_players, 0, num_nodes - 1,
+                          with_information=with_information, cache_size=cache_size,
+                          seed=rng)
@@ -1,4 +1,6 @@
-import numpy as np
+from itertools import product
+
+from payoff_cache import PayoffCache
 
 
 COSTS_2P = {"AB": [3, 6], "BD": [5, 5], "AC": [7, 7], "BC": [0, 0], "CD": [2, 4]}
@@ -6,9 +8,14 @@ COSTS_2P = {"AB": [3, 6], "BD": [5, 5], "AC": [7, 7], "BC": [0, 0], "CD": [2, 4]
 COSTS_3P = {"AB": [2, 3, 5], "BD": [2, 3, 6], "AC": [4, 6, 7], "BC": [1, 2, 8],
             "CD": [1, 5, 6]}
 
+TERMINAL = "D"
+
 
 class SimpleCongestionGame:
-    def __init__(self, num_players, with_information=False):
+    # Potentials are shifted so the best outcome is 0.
+    normalize_potential = True
+
+    def __init__(self, num_players, with_information=False, cache_size=4096):
         if num_players < 2 or num_players >= 4:
             raise ValueError("Simple Congestion Game is only defined for 2 or 3 "
                              "player games.")
@@ -16,31 +23,46 @@ class SimpleCongestionGame:
         self.num_players = int(num_players)
         self.with_information = with_information
 
-        self.player = 0
-        self.scheduled_actions = [""] * num_players
+        self.costs = COSTS_3P if self.num_players == 3 else COSTS_2P
+        self.outgoing = {}
+        for c in self.costs:
+            self.outgoing.setdefault(c[0], []).append(c)
 
-        self.player_positions = ["A"] * num_players
-        self.action_history = []
-        self.player_history = []
-        self.actions_made = []
+        self.utility_cache = PayoffCache(cache_size)
+        self.potential_cache = PayoffCache(cache_size)
+
+        self.reset()
 
-        self.max_potential = -np.inf
+        self.max_potential = max(self.count_potential(sum(paths, []))
+                                 for paths in product(self.get_paths(),
+                                                      repeat=self.num_players))
 
     def reset(self, start_state=None):
-        self.player_positions = start_state if start_state \
+        self.player_positions = list(start_state) if start_state \
                                  else ["A"] * self.num_players
         self.scheduled_actions = [""] * self.num_players
 
         self.player = 0
         self.action_history = []
+        self.player_history = []
         self.actions_made = []
 
+        self.congestion = {c: 0 for c in self.costs}
+        self.edge_players = {c: [] for c in self.costs}
+        self.player_costs = [0] * self.num_players
+        self.player_paths = [[] for _ in range(self.num_players)]
+        self.potential = 0
+
+        self.occupancy = {}
+        for pos in self.player_positions:
+            self.occupancy[pos] = self.occupancy.get(pos, 0) + 1
+        self.finished = self.occupancy.get(TERMINAL, 0)
+
     def get_num_players(self):
         return self.num_players
 
     def get_accompanying(self):
-        return sum(pos == self.player_positions
-                   for pos in self.player_positions) - 1
+        return self.occupancy[self.player_positions[self.player]] - 1
 
     def get_infostate(self):
         return self.player_positions[self.player]
@@ -49,83 +71,135 @@ class SimpleCongestionGame:
         return [["A"] * self.num_players]
 
     def get_valid_actions(self):
-        costs = COSTS_3P if self.num_players == 3 else COSTS_2P
-        return [c for c in costs if c[0] == self.player_positions[self.player]]
+        return self.outgoing.get(self.player_positions[self.player], [])
 
     def get_next_player(self):
         return self.player
 
+    def get_next_active(self, player):
+        for i in range(player + 1, self.num_players):
+            if self.player_positions[i] != TERMINAL:
+                return i
+        return -1
+
     def get_remaining_players(self):
         return [i for i, pos in enumerate(self.scheduled_actions) if not pos
-                and self.player_positions[i] != "D"]
+                and self.player_positions[i] != TERMINAL]
 
     def is_terminal(self):
-        return all(pos == "D" for pos in self.player_positions)
+        return self.finished == self.num_players
+
+    def move(self, player, action):
+        cost = self.costs[action]
+        congestion = self.congestion[action] + 1
+        for i in self.edge_players[action]:
+            self.player_costs[i] += cost[congestion - 1] - cost[congestion - 2]
+        self.player_costs[player] += cost[congestion - 1]
+        self.edge_players[action].append(player)
+        self.player_paths[player].append(action)
+        self.congestion[action] = congestion
+        self.potential -= cost[congestion - 1]
+
+        self.occupancy[action[0]] -= 1
+        self.occupancy[action[-1]] = self.occupancy.get(action[-1], 0) + 1
+        if action[-1] == TERMINAL:
+            self.finished += 1
+        self.player_positions[player] = action[-1]
+
+    def unmove(self, player, action):
+        cost = self.costs[action]
+        congestion = self.congestion[action]
+        self.potential += cost[congestion - 1]
+        self.congestion[action] = congestion - 1
+        self.edge_players[action].pop()
+        self.player_paths[player].pop()
+        self.player_costs[player] -= cost[congestion - 1]
+        for i in self.edge_players[action]:
+            self.player_costs[i] -= cost[congestion - 1] - cost[congestion - 2]
+
+        if action[-1] == TERMINAL:
+            self.finished -= 1
+        self.occupancy[action[-1]] -= 1
+        self.occupancy[action[0]] += 1
+        self.player_positions[player] = action[0]
 
     def make_moves(self):
         actions_made = 0
         for i, a in enumerate(self.scheduled_actions):
             if a:
-                self.player_positions[i] = a[-1]
-                self.action_history += [a]
-                self.player_history += [i]
+                self.move(i, a)
+                self.action_history.append(a)
+                self.player_history.append(i)
+                self.scheduled_actions[i] = ""
                 actions_made += 1
-        self.scheduled_actions = [""] * self.num_players
-        self.actions_made += [actions_made]
-        remaining_players = self.get_remaining_players()
-        self.player = remaining_players[0] if remaining_players else -1
+        self.actions_made.append(actions_made)
+        self.player = self.get_next_active(-1)
 
     def take_action(self, action):
         if action in self.get_valid_actions():
             self.scheduled_actions[self.player] = action
 
-            remaining_players = self.get_remaining_players()
-            if remaining_players:
-                self.player = remaining_players[0]
+            next_player = self.get_next_active(self.player)
+            if next_player >= 0:
+                self.player = next_player
             else:
                 self.make_moves()
 
     def get_scheduled_actions(self):
         return self.scheduled_actions
 
-    def undo_action(self):
-        if self.actions_made and all(not a for a in self.scheduled_actions):
-            players = self.player_history[-self.actions_made[-1]:]
-            actions = self.action_history[-self.actions_made[-1]:]
-
-            for i in range(self.actions_made[-1]):
-                self.player_positions[players[i]] = actions[i][0]
-                self.scheduled_actions[players[i]] = actions[i]
-            self.player = players[-1]
-            self.scheduled_actions[players[-1]] = ""
+    def is_round_start(self):
+        return not any(self.scheduled_actions)
 
-            self.player_history = self.player_history[:-self.actions_made[-1]]
-            self.action_history = self.action_history[:-self.actions_made[-1]]
-            self.actions_made.pop(-1)
+    def undo_action(self):
+        if self.actions_made and not any(self.scheduled_actions):
+            last_player = self.player_history[-1]
+            for _ in range(self.actions_made.pop()):
+                player = self.player_history.pop()
+                action = self.action_history.pop()
+                self.unmove(player, action)
+                self.scheduled_actions[player] = action
+            self.player = last_player
+            self.scheduled_actions[last_player] = ""
 
         elif any(self.scheduled_actions):
             self.player = max(i for i, a in enumerate(self.scheduled_actions) if a)
             self.scheduled_actions[self.player] = ""
 
+    def get_paths(self, node="A"):
+        if node == TERMINAL:
+            return [[]]
+        return [[c] + path for c in self.outgoing.get(node, [])
+                for path in self.get_paths(c[-1])]
+
+    def count_potential(self, action_history):
+        potential = 0
+        congestion = {c: sum(a == c for a in action_history) for c in self.costs}
+        for move in congestion:
+            potential -= sum(self.costs[move][:congestion[move]])
+        return potential
+
+    def get_outcome(self):
+        return tuple(map(tuple, self.player_paths))
+
+    def get_congestion_outcome(self):
+        return tuple(sorted(self.action_history))
+
+    def get_cache_stats(self):
+        return {"utility": self.utility_cache.get_stats(),
+                "potential": self.potential_cache.get_stats()}
+
+    def count_utility(self):
+        utility = [-c for c in self.player_costs]
+        average_utility = sum(utility) / self.num_players
+        zerosum_utility = [u - average_utility for u in utility]
+        return zerosum_utility
+
     def get_utility(self):
         if self.is_terminal():
-            utility = [0] * self.num_players
-            costs = COSTS_3P if self.num_players == 3 else COSTS_2P
-            congestion = {c: sum(a == c for a in self.action_history) for c in costs}
-            for i, a in zip(self.player_history, self.action_history):
-                utility[i] -= costs[a][congestion[a]-1]
-            average_utility = sum(utility) / self.num_players
-            zerosum_utility = [u - average_utility for u in utility]
-            return zerosum_utility
+            return list(self.utility_cache.get(self.get_outcome(), self.count_utility))
 
     def get_potential(self):
         if self.is_terminal():
-            potential = 0
-            costs = COSTS_3P if self.num_players == 3 else COSTS_2P
-            congestion = {c: sum(a == c for a in self.action_history) for c in costs}
-            for move in congestion:
-                potential -= sum(costs[move][:congestion[move]])
-            if potential > self.max_potential:
-                self.max_potential = potential
-            result = potential - self.max_potential
-            return result
+            return self.potential_cache.get(self.get_congestion_outcome(),
+                                            lambda: self.potential - self.max_potential)
@@ -0,0 +1,107 @@
+import numpy as np
+
+
+def get_policy(tree, strategies):
+    registry = tree.registry
+    policy = np.zeros((len(registry), max(tree.num_children.max(initial=0), 1)))
+    for i, (player, infostate) in enumerate(registry.keys):
+        actions = registry.actions[i]
+        strategy = strategies.get(infostate)
+        if strategy is None and isinstance(infostate, tuple):
+            strategy = strategies.get(infostate[0])
+
+        row = np.array([strategy.get(a, 0) for a in actions]) if strategy \
+            else np.ones(len(actions))
+        total = row.sum()
+        policy[i, :len(actions)] = row / total if total > 0 else 1 / len(actions)
+    return policy
+
+
+def get_edge_weights(tree, policy):
+    weights = np.ones(tree.get_num_nodes())
+    children = tree.parent >= 0
+    weights[children] = policy[tree.infostate[tree.parent[children]],
+                               tree.action[children]]
+    return weights
+
+
+def evaluate(tree, nodes, values, weights):
+    internal = nodes[tree.num_children[nodes] > 0]
+    children = tree.get_children(internal)
+    values[internal] = 0
+    child_weights = weights[children].reshape((-1,) + (1,) * (values.ndim - 1))
+    np.add.at(values, tree.parent[children], values[children] * child_weights)
+
+
+def get_profile_values(tree, policy):
+    weights = get_edge_weights(tree, policy)
+    values = np.zeros((tree.get_num_nodes(), tree.num_players))
+    terminals = tree.terminal >= 0
+    values[terminals] = tree.utility[tree.terminal[terminals]]
+    for level in reversed(tree.levels):
+        evaluate(tree, level, values, weights)
+    return values[tree.roots].mean(axis=0)
+
+
+def get_best_response(tree, policy, player):
+    registry = tree.registry
+    weights = get_edge_weights(tree, policy)
+    own_node = tree.player == player
+
+    # Counterfactual reach: start states are uniform chance outcomes and the
+    # best responder's own actions are left out.
+    reach = np.zeros(tree.get_num_nodes())
+    reach[tree.roots] = 1 / len(tree.roots)
+    for level in tree.levels[1:]:
+        parents = tree.parent[level]
+        reach[level] = reach[parents] * np.where(own_node[parents], 1, weights[level])
+
+    # Number of decisions the player still has to make below each node. It
+    # only depends on the player's position, so every infostate is decided
+    # after all infostates that can follow it.
+    height = np.zeros(tree.get_num_nodes(), dtype=np.int64)
+    for level in reversed(tree.levels):
+        height[level] += own_node[level]
+        children = level[tree.parent[level] >= 0]
+        np.maximum.at(height, tree.parent[children], height[children])
+
+    values = np.zeros(tree.get_num_nodes())
+    terminals = tree.terminal >= 0
+    values[terminals] = tree.utility[tree.terminal[terminals], player]
+
+    num_actions = np.array([len(a) for a in registry.actions], dtype=np.int64)
+    valid = np.arange(policy.shape[1]) < num_actions[:, None]
+    best_response = np.zeros(len(registry), dtype=np.int64)
+
+    order = np.lexsort((-tree.depth, height))
+    bounds = np.flatnonzero(np.diff(height[order])) + 1
+    for group in np.split(order, bounds):
+        own = group[own_node[group]]
+        if len(own):
+            children = tree.get_children(own)
+            parents = tree.parent[children]
+            scores = np.where(valid, 0.0, -np.inf)
+            np.add.at(scores, (tree.infostate[parents], tree.action[children]),
+                      reach[parents] * values[children])
+
+            infostates = np.unique(tree.infostate[own])
+            best_response[infostates] = scores[infostates].argmax(axis=1)
+            weights[children] = tree.action[children] == best_response[tree.infostate[parents]]
+
+        depth_bounds = np.flatnonzero(np.diff(tree.depth[group])) + 1
+        for nodes in np.split(group, depth_bounds):
+            evaluate(tree, nodes, values, weights)
+
+    return values[tree.roots].mean(), best_response
+
+
+def get_best_response_values(tree, policy):
+    return np.array([get_best_response(tree, policy, p)[0]
+                     for p in range(tree.num_players)])
+
+
+def get_exploitability(tree, strategies):
+    policy = get_policy(tree, strategies)
+    profile_values = get_profile_values(tree, policy)
+    best_response_values = get_best_response_values(tree, policy)
+    return float((best_response_values - profile_values).sum())
@@ -0,0 +1,170 @@
+import numpy as np
+
+from infostate_registry import InfostateRegistry
+
+
+class GameTree:
+    def __init__(self, num_players, roots, player, infostate, first_child,
+                 num_children, round_start, terminal, utility, potential,
+                 registry, outcomes=None):
+        self.num_players = num_players
+        self.roots = np.asarray(roots, dtype=np.int64)
+
+        self.player = np.asarray(player, dtype=np.int64)
+        self.infostate = np.asarray(infostate, dtype=np.int64)
+        self.first_child = np.asarray(first_child, dtype=np.int64)
+        self.num_children = np.asarray(num_children, dtype=np.int64)
+        self.round_start = np.asarray(round_start, dtype=bool)
+        self.terminal = np.asarray(terminal, dtype=np.int64)
+
+        self.utility = np.asarray(utility, dtype=float).reshape(-1, num_players)
+        self.potential = np.asarray(potential, dtype=float)
+
+        self.registry = registry
+        self.outcomes = outcomes
+        self.node_lists = None
+        self.transpositions = None
+
+        internal = np.flatnonzero(self.num_children > 0)
+        children = self.get_children(internal)
+        self.parent = np.full(len(self.player), -1, dtype=np.int64)
+        self.parent[children] = np.repeat(internal, self.num_children[internal])
+        self.action = np.zeros(len(self.player), dtype=np.int64)
+        self.action[children] = children - self.first_child[self.parent[children]]
+
+        self.levels = [self.roots]
+        while True:
+            children = self.get_children(self.levels[-1])
+            if not len(children):
+                break
+            self.levels.append(children)
+        self.depth = np.zeros(len(self.player), dtype=np.int64)
+        for depth, level in enumerate(self.levels):
+            self.depth[level] = depth
+
+    def get_node_lists(self):
+        # Plain lists index faster than arrays one node at a time.
+        if self.node_lists is None:
+            self.node_lists = (self.terminal.tolist(), self.player.tolist(),
+                               self.infostate.tolist(), self.first_child.tolist(),
+                               self.round_start.tolist())
+        return self.node_lists
+
+    def get_transpositions(self):
+        # Round-start nodes whose subtrees match node for node, with the same
+        # infostates, round boundaries and terminal utilities, have the same
+        # utility under the same strategies. Each class of them with more than
+        # one member, and every start state, is an entry represented by its
+        # first node. Entries are ordered by height, so an entry comes before
+        # every entry nested in it.
+        if self.transpositions is None:
+            terminal, _, infostate, first_child, round_start = self.get_node_lists()
+            num_children = self.num_children.tolist()
+            utility = self.utility.tolist()
+            canonical = [0] * self.get_num_nodes()
+            height = [0] * self.get_num_nodes()
+            ids = {}
+            for level in reversed(self.levels):
+                for node in level.tolist():
+                    if terminal[node] >= 0:
+                        payload = tuple(utility[terminal[node]])
+                    else:
+                        children = range(first_child[node],
+                                         first_child[node] + num_children[node])
+                        payload = tuple(canonical[c] for c in children)
+                        height[node] = 1 + max(height[c] for c in children)
+                    canonical[node] = ids.setdefault(
+                        (infostate[node], round_start[node], payload), len(ids))
+
+            first = {}
+            repeated = {canonical[root] for root in self.roots.tolist()}
+            for node in range(self.get_num_nodes()):
+                if round_start[node] and terminal[node] < 0:
+                    if canonical[node] in first:
+                        repeated.add(canonical[node])
+                    else:
+                        first[canonical[node]] = node
+            owners = sorted((first[c] for c in repeated),
+                            key=lambda node: (-height[node], node))
+            entries = {canonical[node]: e for e, node in enumerate(owners)}
+            self.transpositions = [entries.get(c, -1) for c in canonical], owners
+        return self.transpositions
+
+    def get_children(self, nodes):
+        counts = self.num_children[nodes]
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(self.first_child[nodes], counts) + offsets
+
+    def get_num_nodes(self):
+        return len(self.player)
+
+    def get_num_infostates(self):
+        return len(self.registry)
+
+
+def compile_game(game, registry=None):
+    registry = registry if registry is not None else InfostateRegistry()
+
+    player = []
+    infostate = []
+    first_child = []
+    num_children = []
+    round_start = []
+    terminal = []
+    utility = []
+    potential = []
+    outcomes = []
+
+    def allocate(count):
+        start = len(player)
+        player.extend([-1] * count)
+        infostate.extend([-1] * count)
+        first_child.extend([-1] * count)
+        num_children.extend([0] * count)
+        round_start.extend([False] * count)
+        terminal.extend([-1] * count)
+        return start
+
+    def visit(node):
+        round_start[node] = game.is_round_start()
+        if game.is_terminal():
+            terminal[node] = len(potential)
+            utility.append(game.get_utility())
+            potential.append(game.get_potential())
+            outcomes.append(game.get_outcome())
+            return []
+
+        next_player = game.get_next_player()
+        index = registry.intern(next_player, game.get_infostate(),
+                                game.get_valid_actions())
+        actions = registry.actions[index]
+        player[node] = next_player
+        infostate[node] = index
+        num_children[node] = len(actions)
+        first_child[node] = allocate(len(actions))
+        return actions
+
+    roots = []
+    for state in game.get_all_start_states():
+        game.reset(start_state=state)
+        root = allocate(1)
+        roots.append(root)
+
+        stack = [[root, visit(root), 0]]
+        while stack:
+            frame = stack[-1]
+            node, node_actions, i = frame
+            if i == len(node_actions):
+                stack.pop()
+                if stack:
+                    game.undo_action()
+                continue
+
+            frame[2] = i + 1
+            game.take_action(node_actions[i])
+            child = first_child[node] + i
+            stack.append([child, visit(child), 0])
+
+    return GameTree(game.get_num_players(), roots, player, infostate,
+                    first_child, num_children, round_start, terminal,
+                    utility, potential, registry, outcomes)
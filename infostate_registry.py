@@ -0,0 +1,33 @@
+import numpy as np
+
+
+class InfostateRegistry:
+    def __init__(self):
+        self.ids = {}
+        self.keys = []
+        self.actions = []
+        self.players = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def intern(self, player, infostate, actions):
+        key = (player, infostate)
+        index = self.ids.get(key)
+        if index is None:
+            index = len(self.keys)
+            self.ids[key] = index
+            self.keys.append(key)
+            self.actions.append(list(actions))
+            self.players.append(player)
+        return index
+
+    def get_groups(self, group_key):
+        group_ids = {}
+        groups = []
+        for key in self.keys:
+            group = group_key(key)
+            if group not in group_ids:
+                group_ids[group] = len(group_ids)
+            groups.append(group_ids[group])
+        return list(group_ids), np.asarray(groups, dtype=np.int64)
@@ -0,0 +1,117 @@
+import numpy as np
+
+from time import perf_counter
+
+
+EVENTS = ("iteration_start", "iteration_end", "traversal", "terminal")
+COUNTERS = ("iterations", "traversals", "nodes_visited", "terminals_evaluated",
+            "infostates_created")
+TIMERS = ("game", "traversal", "regret_check", "recording", "exploitability",
+          "checkpoint")
+
+
+class NoInstrumentation:
+    def attach(self, solver):
+        pass
+
+    def detach(self, solver):
+        pass
+
+    def start_iteration(self, solver):
+        pass
+
+    def end_traversal(self, solver, root, utility):
+        pass
+
+    def end_iteration(self, solver, regret):
+        pass
+
+    def lap(self, timer):
+        pass
+
+    def add_time(self, timer, seconds):
+        pass
+
+    def count(self, counter, n=1):
+        pass
+
+
+class Instrumentation(NoInstrumentation):
+    def __init__(self):
+        self.hooks = {event: [] for event in EVENTS}
+        self.reset()
+
+    def reset(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.timers = dict.fromkeys(TIMERS, 0.0)
+        self.last_lap = perf_counter()
+
+    def add_hook(self, event, callback):
+        self.hooks[event].append(callback)
+
+    def remove_hook(self, event, callback):
+        self.hooks[event].remove(callback)
+
+    def attach(self, solver):
+        # The solvers count nodes themselves. Terminal hooks need a call per
+        # node, so only then is the traversal routed through a recursive
+        # walk_trees shadowed by a counting wrapper, which the recursive calls
+        # pick up as well. Terminal hooks are added before attaching.
+        if self.hooks["terminal"]:
+            solver.check_terminal_hooks()
+            walk_trees = type(solver).walk_trees
+            counters = self.counters
+            terminal_hooks = self.hooks["terminal"]
+
+            def counting_walk(node, *args):
+                counters["nodes_visited"] += 1
+                if solver.tree.terminal[node] >= 0:
+                    counters["terminals_evaluated"] += 1
+                    for hook in terminal_hooks:
+                        hook(solver, node)
+                return walk_trees(solver, node, *args)
+
+            solver.walk_trees = counting_walk
+            solver.walk_stack = counting_walk
+
+    def detach(self, solver):
+        solver.__dict__.pop("walk_trees", None)
+        solver.__dict__.pop("walk_stack", None)
+
+    def start_iteration(self, solver):
+        self.counters["iterations"] += 1
+        for hook in self.hooks["iteration_start"]:
+            hook(solver)
+        self.last_lap = perf_counter()
+
+    def end_traversal(self, solver, root, utility):
+        self.counters["traversals"] += 1
+        if self.hooks["traversal"]:
+            # The utility may be a view into scratch space that the next
+            # traversal overwrites.
+            utility = np.copy(utility)
+            for hook in self.hooks["traversal"]:
+                hook(solver, root, utility)
+
+    def end_iteration(self, solver, regret):
+        for hook in self.hooks["iteration_end"]:
+            hook(solver, regret)
+
+    def lap(self, timer):
+        now = perf_counter()
+        self.timers[timer] += now - self.last_lap
+        self.last_lap = now
+
+    def add_time(self, timer, seconds):
+        self.timers[timer] += seconds
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    def get_stats(self):
+        stats = dict(self.counters)
+        stats.update({timer + "_seconds": seconds for timer, seconds in self.timers.items()})
+        traversal = self.timers["traversal"]
+        stats["nodes_per_second"] = self.counters["nodes_visited"] / traversal \
+            if traversal > 0 else 0.0
+        return stats
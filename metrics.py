@@ -0,0 +1,342 @@
+import os
+import numpy as np
+
+from ast import literal_eval
+
+
+ENCODINGS = ("dense", "changes")
+
+
+def get_column_layout(strategies):
+    return [(key, action) for key in strategies for action in strategies[key]]
+
+
+def iter_strategy_rows(strategy_list, layout, chunk_size=1024):
+    # Snapshots as (snapshots, columns) arrays in the given (key, action)
+    # column order, with NaN for columns a snapshot does not have.
+    if isinstance(strategy_list, (StrategySnapshots, StrategyHistory)):
+        yield from strategy_list.iter_rows(layout, chunk_size)
+        return
+    for start in range(0, len(strategy_list), chunk_size):
+        rows = [[strategies.get(key, {}).get(action, np.nan) for key, action in layout]
+                for strategies in strategy_list[start:start + chunk_size]]
+        yield np.array(rows, dtype=float).reshape((-1, len(layout)))
+
+
+def get_strategies(layout, row):
+    strategies = {}
+    for (key, action), p in zip(layout, row):
+        strategies.setdefault(key, {})[action] = p
+    return strategies
+
+
+def get_results(solver):
+    # A trained solver's results as plain lists for CSV and JSON. The final
+    # exploitability is computed here and closes the exploitability table.
+    exploitability = float(solver.get_exploitability())
+    exploitability_table = [[int(t), float(e)] for t, e in solver.get_exploitability_table()]
+    if not exploitability_table or exploitability_table[-1][0] != solver.t:
+        exploitability_table.append([solver.t, exploitability])
+    regret_table = solver.metrics.get_regret_table() if solver.metrics is not None \
+        else solver.regret_table
+    strategies = [{"infostate": key if isinstance(key, tuple) else [key],
+                   "strategy": [[a, float(p)] for a, p in strategy.items()]}
+                  for key, strategy in solver.get_average_strategies().items()]
+    return {"iterations": solver.t,
+            "exploitability": exploitability,
+            "regret_columns": solver.get_regret_columns(),
+            "regret_table": [[int(row[0])] + [float(r) for r in row[1:]]
+                             for row in regret_table],
+            "exploitability_table": exploitability_table,
+            "strategies": strategies}
+
+
+class MetricsWriter:
+    def __init__(self, path, columns, buffer_size=1024, dtype=float):
+        self.path = path
+        self.columns = list(columns)
+        self.buffer = np.zeros((buffer_size, len(self.columns)), dtype=dtype)
+        self.buffered = 0
+        self.written = 0
+        self.created = False
+
+    def __len__(self):
+        return self.written + self.buffered
+
+    def append(self, row):
+        self.buffer[self.buffered] = row
+        self.buffered += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    def create(self):
+        with open(self.path, "wb") as f:
+            np.lib.format.write_array(f, np.array(self.columns, dtype=str))
+        self.created = True
+
+    def resume(self, rows):
+        reader = MetricsReader(self.path)
+        if reader.columns != self.columns or reader.dtype != self.buffer.dtype \
+                or len(reader) < rows:
+            raise ValueError("Metrics file %s does not match the checkpoint." % self.path)
+
+        self.buffered = 0
+        self.written = rows
+        self.created = True
+        for (first, num_rows, _), header in zip(reader.chunks, reader.headers):
+            if first + num_rows > rows:
+                tail = np.array(reader.read(first, rows))
+                with open(self.path, "r+b") as f:
+                    f.truncate(header)
+                self.written = first
+                for row in tail:
+                    self.append(row)
+                break
+
+    def add_columns(self, columns):
+        # Rewrites the file with the columns appended, NaN in the rows so far.
+        self.flush()
+        width = len(self.columns)
+        self.columns += list(columns)
+        self.buffer = np.zeros((len(self.buffer), len(self.columns)), dtype=self.buffer.dtype)
+        if not self.written:
+            self.created = False
+            return
+
+        reader = MetricsReader(self.path)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.lib.format.write_array(f, np.array(self.columns, dtype=str))
+            for chunk in reader.iter_chunks(len(self.buffer)):
+                rows = np.full((len(chunk), len(self.columns)), np.nan, dtype=chunk.dtype)
+                rows[:, :width] = chunk
+                np.lib.format.write_array(f, rows)
+        os.replace(temp_path, self.path)
+
+    def flush(self):
+        if not self.created:
+            self.create()
+        if self.buffered:
+            with open(self.path, "ab") as f:
+                np.lib.format.write_array(f, self.buffer[:self.buffered])
+            self.written += self.buffered
+            self.buffered = 0
+
+
+class MetricsReader:
+    def __init__(self, path):
+        self.path = path
+        self.chunks = []
+        self.headers = []
+        self.num_rows = 0
+        self.dtype = np.dtype(float)
+
+        with open(self.path, "rb") as f:
+            self.columns = np.lib.format.read_array(f).tolist()
+            while True:
+                header = f.tell()
+                try:
+                    version = np.lib.format.read_magic(f)
+                except ValueError:
+                    break
+                if version == (1, 0):
+                    shape, _, self.dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, _, self.dtype = np.lib.format.read_array_header_2_0(f)
+
+                self.headers.append(header)
+                self.chunks.append((self.num_rows, shape[0], f.tell()))
+                self.num_rows += shape[0]
+                f.seek(shape[0] * len(self.columns) * self.dtype.itemsize, 1)
+
+    def __len__(self):
+        return self.num_rows
+
+    def read(self, start=0, stop=None):
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        row_size = len(self.columns) * self.dtype.itemsize
+        parts = []
+        for first, rows, offset in self.chunks:
+            lo, hi = max(start, first), min(stop, first + rows)
+            if lo < hi:
+                parts.append(np.memmap(self.path, dtype=self.dtype, mode="r",
+                                       offset=offset + (lo - first) * row_size,
+                                       shape=(hi - lo, len(self.columns))))
+        if not parts:
+            return np.zeros((0, len(self.columns)), dtype=self.dtype)
+        return np.concatenate(parts)
+
+    def iter_chunks(self, chunk_size=1024):
+        for start in range(0, self.num_rows, chunk_size):
+            yield self.read(start, start + chunk_size)
+
+
+class StrategySnapshots:
+    def __init__(self, reader):
+        self.reader = reader
+        self.layout = [literal_eval(c) for c in reader.columns]
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __getitem__(self, t):
+        if t < 0:
+            t += len(self)
+        if not 0 <= t < len(self):
+            raise IndexError("strategy snapshot index out of range")
+
+        return get_strategies(self.layout, self.reader.read(t, t + 1)[0])
+
+    def __iter__(self):
+        for t in range(len(self)):
+            yield self[t]
+
+    def iter_rows(self, layout, chunk_size=1024):
+        index = {c: i for i, c in enumerate(self.layout)}
+        columns = np.array([index.get(c, -1) for c in layout], dtype=np.int64)
+        for chunk in self.reader.iter_chunks(chunk_size):
+            rows = chunk[:, columns]
+            rows[:, columns < 0] = np.nan
+            yield rows
+
+
+class StrategyHistory:
+    # Strategy snapshots as float32 rows over a column layout that only grows
+    # at the end. The "changes" encoding stores a dense keyframe every
+    # keyframe_rate rows and only the changed columns in between.
+    def __init__(self, encoding="dense", keyframe_rate=256):
+        if encoding not in ENCODINGS:
+            raise ValueError("Unknown snapshot encoding %r, expected one of %s."
+                             % (encoding, ", ".join(ENCODINGS)))
+        self.encoding = encoding
+        self.keyframe_rate = keyframe_rate
+        self.layout = []
+        self.num_rows = 0
+        self.rows = np.zeros((0, 0), dtype=np.float32)
+        self.keyframes = []
+        self.changes = []
+        self.last = np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return self.num_rows
+
+    def append(self, layout, row):
+        if len(layout) > len(self.layout):
+            self.layout = list(layout)
+        width = len(self.layout)
+
+        if self.encoding == "dense":
+            if self.num_rows == len(self.rows) or width > self.rows.shape[1]:
+                rows = np.full((max(2 * self.num_rows, 16), width), np.nan,
+                               dtype=np.float32)
+                rows[:self.num_rows, :self.rows.shape[1]] = self.rows[:self.num_rows]
+                self.rows = rows
+            self.rows[self.num_rows, :len(row)] = row
+        else:
+            last = np.full(width, np.nan, dtype=np.float32)
+            last[:len(self.last)] = self.last
+            row = np.asarray(row, dtype=np.float32)
+            new = last.copy()
+            new[:len(row)] = row
+            if self.num_rows % self.keyframe_rate == 0:
+                self.keyframes.append(new)
+                changed = np.zeros(0, dtype=np.int64)
+            else:
+                changed = np.flatnonzero((new != last) & ~(np.isnan(new) & np.isnan(last)))
+            self.changes.append((changed.astype(np.int32), new[changed]))
+            self.last = new
+        self.num_rows += 1
+
+    def get_rows(self, start=0, stop=None):
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        width = len(self.layout)
+        if self.encoding == "dense":
+            return self.rows[start:stop, :width].copy()
+
+        rows = np.full((max(stop - start, 0), width), np.nan, dtype=np.float32)
+        row = None
+        for t in range(start, stop):
+            keyframe, offset = divmod(t, self.keyframe_rate)
+            if row is None or offset == 0:
+                row = np.full(width, np.nan, dtype=np.float32)
+                row[:len(self.keyframes[keyframe])] = self.keyframes[keyframe]
+                first = t - offset + 1
+            else:
+                first = t
+            for changed, values in self.changes[first:t + 1]:
+                row[changed] = values
+            rows[t - start] = row
+        return rows
+
+    def __getitem__(self, t):
+        if t < 0:
+            t += len(self)
+        if not 0 <= t < len(self):
+            raise IndexError("strategy snapshot index out of range")
+        return get_strategies(self.layout, self.get_rows(t, t + 1)[0])
+
+    def __iter__(self):
+        for t in range(len(self)):
+            yield self[t]
+
+    def iter_rows(self, layout, chunk_size=1024):
+        index = {c: i for i, c in enumerate(self.layout)}
+        columns = np.array([index.get(c, -1) for c in layout], dtype=np.int64)
+        for start in range(0, self.num_rows, chunk_size):
+            rows = self.get_rows(start, start + chunk_size)[:, columns]
+            rows[:, columns < 0] = np.nan
+            yield rows
+
+
+class MetricsSink:
+    def __init__(self, prefix, regret_columns, buffer_size=1024):
+        self.regret_path = prefix + "_regrets.metrics"
+        self.strategy_path = prefix + "_strategies.metrics"
+        self.buffer_size = buffer_size
+
+        self.regrets = MetricsWriter(self.regret_path, regret_columns, buffer_size)
+        self.strategies = None
+        self.layout = None
+
+    def append(self, regret_row, layout, strategy_row):
+        # Layouts only grow at the end. New columns are added to the file,
+        # and rows narrower than it, as after resuming, are padded with NaN.
+        if self.strategies is None:
+            self.layout = list(layout)
+            self.strategies = MetricsWriter(self.strategy_path,
+                                            [repr(c) for c in self.layout],
+                                            self.buffer_size, np.float32)
+        elif len(layout) > len(self.layout):
+            self.strategies.add_columns([repr(c) for c in layout[len(self.layout):]])
+            self.layout = list(layout)
+
+        if len(strategy_row) < len(self.layout):
+            row = np.full(len(self.layout), np.nan, dtype=np.float32)
+            row[:len(strategy_row)] = strategy_row
+            strategy_row = row
+        self.regrets.append(regret_row)
+        self.strategies.append(strategy_row)
+
+    def resume(self, rows):
+        self.regrets.resume(rows)
+        if os.path.exists(self.strategy_path) and rows:
+            reader = MetricsReader(self.strategy_path)
+            self.layout = [literal_eval(c) for c in reader.columns]
+            self.strategies = MetricsWriter(self.strategy_path, reader.columns,
+                                            self.buffer_size, reader.dtype)
+            self.strategies.resume(rows)
+
+    def flush(self):
+        self.regrets.flush()
+        if self.strategies is not None:
+            self.strategies.flush()
+
+    def get_regret_table(self):
+        self.flush()
+        return MetricsReader(self.regret_path).read()
+
+    def get_strategy_list(self):
+        self.flush()
+        if self.strategies is None:
+            return []
+        return StrategySnapshots(MetricsReader(self.strategy_path))
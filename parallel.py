@@ -0,0 +1,64 @@
+import numpy as np
+
+
+_solver = None
+
+
+def init_worker(solver_class, game, variant):
+    global _solver
+    _solver = solver_class(game, variant=variant)
+    _solver.get_tree()
+
+
+def traverse(t, regret_sum, roots, rng):
+    store = _solver.store
+    size = store.size
+    _solver.t = t
+    _solver.rng = rng
+    _solver.regret_weight, _solver.strategy_weight = _solver.variant.get_weights(t)
+
+    store.regret_sum[:size] = regret_sum
+    store.strategy_sum[:size] = 0
+    store.reach_sum[:size] = 0
+    for root in roots:
+        _solver.walk_stack(root)
+
+    return (store.regret_sum[:size] - regret_sum,
+            store.strategy_sum[:size].copy(),
+            store.reach_sum[:size].copy())
+
+
+class StartStatePool:
+    def __init__(self, solver, workers):
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.solver = solver
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(workers, initializer=init_worker,
+                                            initargs=(type(solver), solver.game,
+                                                      solver.variant))
+
+    def walk_trees(self):
+        solver = self.solver
+        tree = solver.get_tree()
+        store = solver.store
+        size = store.size
+        regret_sum = store.regret_sum[:size].copy()
+
+        chunks = [roots for roots in np.array_split(tree.roots, self.workers)
+                  if len(roots)]
+        # Every chunk samples from its own child stream of the solver's seed,
+        # keyed by iteration and chunk, so results do not depend on which
+        # worker runs it and a resumed run draws the same streams.
+        futures = [self.executor.submit(traverse, solver.t, regret_sum, roots, rng)
+                   for roots, rng in zip(chunks, solver.rng.spawn(len(chunks), (solver.t,)))]
+
+        for future in futures:
+            regret_delta, strategy_sum, reach_sum = future.result()
+            store.regret_sum[:size] += regret_delta
+            store.strategy_sum[:size] += strategy_sum
+            store.reach_sum[:size] += reach_sum
+        store.refresh_max_regrets()
+
+    def close(self):
+        self.executor.shutdown()
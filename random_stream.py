@@ -0,0 +1,56 @@
+import numpy as np
+
+from bisect import bisect_right
+from itertools import accumulate
+
+
+class RandomStream:
+    def __init__(self, seed=None, block_size=1024):
+        self.generator = seed if isinstance(seed, np.random.Generator) \
+            else np.random.default_rng(seed)
+        self.block_size = block_size
+        self.block = []
+        self.position = 0
+
+    def random(self):
+        # Uniform draws are generated a block at a time.
+        if self.position == len(self.block):
+            self.block = self.generator.random(self.block_size).tolist()
+            self.position = 0
+        u = self.block[self.position]
+        self.position += 1
+        return u
+
+    def choose(self, weights):
+        cumulative = list(accumulate(weights.tolist()))
+        return min(bisect_right(cumulative, self.random() * cumulative[-1]),
+                   len(cumulative) - 1)
+
+    def choice(self, items):
+        return items[int(self.random() * len(items))]
+
+    def sample(self, items, k):
+        items = list(items)
+        for i in range(k):
+            j = i + int(self.random() * (len(items) - i))
+            items[i], items[j] = items[j], items[i]
+        return items[:k]
+
+    def spawn(self, n, key=()):
+        # Children are keyed by the caller instead of by how many were spawned
+        # before, which a checkpoint does not save.
+        seed_seq = self.generator.bit_generator.seed_seq
+        bit_generator = type(self.generator.bit_generator)
+        return [RandomStream(np.random.Generator(bit_generator(np.random.SeedSequence(
+                    seed_seq.entropy, spawn_key=seed_seq.spawn_key + tuple(key) + (i,),
+                    pool_size=seed_seq.pool_size))), self.block_size)
+                for i in range(n)]
+
+    def get_state(self):
+        return repr(self.generator.bit_generator.state), \
+            np.array(self.block[self.position:], dtype=float)
+
+    def set_state(self, generator_state, block):
+        self.generator.bit_generator.state = generator_state
+        self.block = block.tolist()
+        self.position = 0
@@ -0,0 +1,167 @@
+import numpy as np
+
+
+class RegretStore:
+    def __init__(self, utility_shape=(), initial_regret=0, capacity=16, width=2,
+                 num_owners=1, batch_shape=()):
+        self.utility_shape = tuple(utility_shape)
+        self.batch_shape = tuple(batch_shape)
+        self.initial_regret = initial_regret
+        self.regret_total = np.zeros((num_owners,) + self.batch_shape)
+        self.size = 0
+        self.capacity = 0
+        self.width = 0
+        self.minimizers = []
+
+        self.num_actions = np.zeros(0, dtype=np.int64)
+        self.owner = np.zeros(0, dtype=np.int64)
+        self.max_regret = np.zeros(self.batch_shape + (0,))
+        self.mask = np.zeros((0, 0), dtype=bool)
+        self.regret_sum = np.zeros(self.batch_shape + (0, 0))
+        self.strategy_sum = np.zeros(self.batch_shape + (0, 0))
+        self.reach_sum = np.zeros(self.batch_shape + (0,))
+        self.action_util = np.zeros(self.batch_shape + (0, 0) + self.utility_shape)
+        self.infostate_util = np.zeros(self.batch_shape + (0,) + self.utility_shape)
+        self.resize(capacity, width)
+
+    def resize(self, capacity, width):
+        capacity = max(capacity, self.size)
+        width = max(width, self.width)
+
+        def grow(old, shape, dtype=float):
+            new = np.zeros(shape, dtype=dtype)
+            new[tuple(slice(0, n) for n in old.shape)] = old
+            return new
+
+        self.num_actions = grow(self.num_actions, capacity, np.int64)
+        self.owner = grow(self.owner, capacity, np.int64)
+        batch_shape = self.batch_shape
+        self.max_regret = grow(self.max_regret, batch_shape + (capacity,))
+        self.mask = grow(self.mask, (capacity, width), bool)
+        self.regret_sum = grow(self.regret_sum, batch_shape + (capacity, width))
+        self.strategy_sum = grow(self.strategy_sum, batch_shape + (capacity, width))
+        self.reach_sum = grow(self.reach_sum, batch_shape + (capacity,))
+
+        self.action_util = grow(self.action_util,
+                                batch_shape + (capacity, width) + self.utility_shape)
+        self.infostate_util = grow(self.infostate_util,
+                                   batch_shape + (capacity,) + self.utility_shape)
+
+        self.capacity = capacity
+        self.width = width
+        for i in range(self.size):
+            self.bind(i)
+
+    def add(self, minimizer, owner=0):
+        num_actions = minimizer.num_actions
+        if self.size == self.capacity or num_actions > self.width:
+            self.resize(max(2 * self.size, self.capacity),
+                        max(num_actions, self.width))
+
+        index = self.size
+        self.size += 1
+        self.minimizers.append(minimizer)
+
+        self.num_actions[index] = num_actions
+        self.owner[index] = owner
+        self.mask[index, :num_actions] = True
+        self.regret_sum[..., index, :num_actions] = self.initial_regret
+        if num_actions:
+            self.max_regret[..., index] = max(self.initial_regret, 0)
+            self.regret_total[owner] += max(self.initial_regret, 0)
+        self.bind(index)
+        return index
+
+    def bind(self, index):
+        rm = self.minimizers[index]
+        num_actions = rm.num_actions
+        batch = (slice(None),) * len(self.batch_shape)
+        rm.regret_sum = self.regret_sum[batch + (index, slice(num_actions))]
+        rm.strategy_sum = self.strategy_sum[batch + (index, slice(num_actions))]
+        rm.reach_sum = self.reach_sum[batch + (slice(index, index + 1),)]
+        # Action utilities are action-major, so a traversal indexes an action
+        # the same way with or without a batch.
+        rm.action_util = np.moveaxis(self.action_util[batch + (index, slice(num_actions))],
+                                     len(self.batch_shape), 0)
+        if self.utility_shape:
+            rm.infostate_util = self.infostate_util[batch + (index,)]
+
+    def get_average_strategies(self):
+        size = self.size
+        reach_sum = self.reach_sum[..., :size, None]
+        uniform = self.mask[:size] / np.maximum(self.num_actions[:size, None], 1)
+        return np.where(reach_sum > 0,
+                        self.strategy_sum[..., :size, :] / np.where(reach_sum > 0, reach_sum, 1),
+                        uniform)
+
+    def get_max_regrets(self):
+        regret_sum = np.where(self.mask[:self.size], self.regret_sum[..., :self.size, :],
+                              -np.inf)
+        return regret_sum.max(axis=-1, initial=-np.inf)
+
+    def set_max_regret(self, index, regret):
+        regret = max(regret, 0)
+        self.regret_total[self.owner[index]] += regret - self.max_regret[index]
+        self.max_regret[index] = regret
+
+    def set_batch_max_regret(self, index, regret):
+        regret = np.maximum(regret, 0)
+        self.regret_total[self.owner[index]] += regret - self.max_regret[..., index]
+        self.max_regret[..., index] = regret
+
+    def refresh_max_regrets(self):
+        size = self.size
+        self.max_regret[..., :size] = np.maximum(self.get_max_regrets(), 0)
+        self.regret_total = np.zeros_like(self.regret_total)
+        np.add.at(self.regret_total, self.owner[:size],
+                  np.moveaxis(self.max_regret[..., :size], -1, 0))
+
+
+class AverageStrategies:
+    def __init__(self, registry, store, group_key):
+        self.registry = registry
+        self.store = store
+        self.group_key = group_key
+        self.size = -1
+
+    def update_groups(self):
+        # Groups and columns only change when new infostates are interned.
+        registry = self.registry
+        if self.size == len(registry):
+            return
+        self.keys, self.groups = registry.get_groups(self.group_key)
+        _, self.first, counts = np.unique(self.groups, return_index=True,
+                                          return_counts=True)
+        self.counts = counts[:, None]
+        self.actions = [registry.actions[i] for i in self.first]
+
+        self.layout = [(key, a) for key, actions in zip(self.keys, self.actions)
+                       for a in actions]
+        self.column_groups = np.array([g for g, actions in enumerate(self.actions)
+                                       for _ in actions], dtype=np.int64)
+        self.column_slots = np.array([j for actions in self.actions
+                                      for j in range(len(actions))], dtype=np.int64)
+        if self.store.batch_shape:
+            self.layout = [((k, key), a) for k in range(self.store.batch_shape[0])
+                           for key, a in self.layout]
+
+        self.average = np.zeros(self.store.batch_shape + (len(self.keys), self.store.width))
+        self.size = len(registry)
+
+    def get_average(self):
+        self.update_groups()
+        average = self.average
+        average.fill(0)
+        batch = (slice(None),) * len(self.store.batch_shape)
+        np.add.at(average, batch + (self.groups,), self.store.get_average_strategies())
+        average /= self.counts
+        return average
+
+    def get_strategies(self):
+        average = self.get_average()
+        return {key: dict(zip(actions, avg_strategy))
+                for key, actions, avg_strategy in zip(self.keys, self.actions, average)}
+
+    def get_row(self):
+        average = self.get_average()
+        return self.layout, average[..., self.column_groups, self.column_slots].ravel()
@@ -0,0 +1,198 @@
+import numpy as np
+
+from time import perf_counter
+
+from checkpoint import CheckpointWriter, get_state, read_state, set_state, write_state
+from exploitability import get_exploitability
+from cfr_variants import get_variant
+from game_tree import compile_game
+from infostate_registry import InfostateRegistry
+from instrumentation import NoInstrumentation
+from metrics import MetricsSink, StrategyHistory
+from parallel import StartStatePool
+from random_stream import RandomStream
+from regret_store import AverageStrategies
+
+
+class Solver:
+    # Training loop, recording, exploitability tracking, checkpoints and
+    # instrumentation shared by the solvers. Subclasses walk the game in
+    # walk_roots and define how regret is reported and checked. Solvers that
+    # sample the live game instead of the compiled tree clear compiled.
+    compiled = True
+
+    def __init__(self, game, store, group_key, metrics_prefix=None, buffer_size=1024,
+                 variant="vanilla", snapshot_encoding="dense", seed=None):
+        self.game = game
+        self.variant = get_variant(variant)
+        self.rng = RandomStream(seed)
+        self.registry = InfostateRegistry()
+        self.regret_minimizers = []
+        self.store = store
+        self.average_strategies = AverageStrategies(self.registry, self.store, group_key)
+        self.tree = None
+        self.frames = []
+        self.pool = None
+        self.checkpoints = None
+        self.instrumentation = NoInstrumentation()
+        self.t = 1
+        self.regret_weight = 1
+        self.strategy_weight = 1
+        self.regret_table = []
+        self.strategy_list = StrategyHistory(snapshot_encoding)
+        self.exploitability_table = []
+        self.exploitability = np.inf
+        self.metrics = MetricsSink(metrics_prefix, self.get_regret_columns(), buffer_size) \
+            if metrics_prefix is not None else None
+
+    def get_tree(self):
+        if self.tree is None:
+            start = perf_counter()
+            self.tree = compile_game(self.game, self.registry)
+            self.add_regret_minimizers()
+            self.instrumentation.add_time("game", perf_counter() - start)
+            self.instrumentation.count("infostates_created", len(self.registry))
+        return self.tree
+
+    def get_average_strategies(self):
+        return self.average_strategies.get_strategies()
+
+    def get_regret_table(self):
+        import pandas as pd
+
+        regret_table = self.metrics.get_regret_table() if self.metrics is not None \
+            else self.regret_table
+        regret_table = pd.DataFrame(regret_table, columns=self.get_regret_columns())
+        return regret_table.astype({"Iteration": int})
+
+    def get_strategy_list(self):
+        if self.metrics is not None:
+            return self.metrics.get_strategy_list()
+        return self.strategy_list
+
+    def get_exploitability(self):
+        return get_exploitability(self.get_tree(), self.get_average_strategies())
+
+    def get_exploitability_table(self):
+        return self.exploitability_table
+
+    def track_exploitability(self, exploitability_rate):
+        if exploitability_rate and self.t % exploitability_rate == 0:
+            self.exploitability = self.get_exploitability()
+            self.exploitability_table += [[self.t, self.exploitability]]
+        return self.exploitability
+
+    def record(self, regret):
+        layout, strategy_row = self.average_strategies.get_row()
+        regret_row = [self.t] + self.get_regret_row(regret)
+        if self.metrics is not None:
+            self.metrics.append(regret_row, layout, strategy_row)
+        else:
+            self.regret_table += [regret_row]
+            self.strategy_list.append(layout, strategy_row)
+
+    def save_checkpoint(self, path):
+        write_state(path, get_state(self))
+
+    def load_checkpoint(self, path):
+        set_state(self, read_state(path))
+
+    def check_terminal_hooks(self):
+        pass
+
+    def instrument(self, instrumentation=None):
+        self.instrumentation.detach(self)
+        self.instrumentation = instrumentation if instrumentation is not None \
+            else NoInstrumentation()
+        self.instrumentation.attach(self)
+        return self.instrumentation
+
+    def training_iteration(self, update_rate):
+        instrumentation = self.instrumentation
+        if self.compiled:
+            self.get_tree()
+        self.t += 1
+        self.regret_weight, self.strategy_weight = self.variant.get_weights(self.t)
+        instrumentation.start_iteration(self)
+
+        if self.pool is not None:
+            self.pool.walk_trees()
+        else:
+            self.walk_roots()
+        self.variant.end_iteration(self.store, self.t)
+        instrumentation.lap("traversal")
+
+        regret = self.get_overall_regret()
+        instrumentation.lap("regret_check")
+        if self.t % update_rate == 0:
+            self.record(regret)
+            instrumentation.lap("recording")
+
+        instrumentation.end_iteration(self, regret)
+        return regret
+
+    def walk_roots(self):
+        for root in self.get_tree().roots:
+            utility = self.walk_stack(root)[0]
+            self.instrumentation.end_traversal(self, root, utility)
+
+    def get_check_interval(self, regret, epsilon, check_rate):
+        if check_rate != "adaptive":
+            return check_rate
+        # Average regret falls off roughly like 1 / sqrt(t): skip half way to
+        # where the current trend reaches epsilon, but at most doubling t.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.divide(self.get_regret_scale(regret), epsilon)
+        if not np.isfinite(ratio):
+            return self.t
+        return int(min(max(self.t * (ratio ** 2 - 1) / 2, 1), self.t))
+
+    def check_pool(self):
+        pass
+
+    def train(self, iterations=1, epsilon=np.inf, update_rate=1, workers=1,
+              exploitability_rate=0, target_exploitability=np.inf, check_rate=1,
+              checkpoint_path=None, checkpoint_rate=0, resume=False):
+        if not resume:
+            self.t = 0
+            self.exploitability = np.inf
+        if target_exploitability < np.inf and not exploitability_rate:
+            exploitability_rate = 1
+        if workers > 1:
+            self.check_pool()
+        self.pool = StartStatePool(self, workers) if workers > 1 else None
+        self.checkpoints = CheckpointWriter(checkpoint_path, checkpoint_rate) \
+            if checkpoint_path is not None else None
+
+        try:
+            next_check = 0
+            while True:
+                regret = self.training_iteration(update_rate)
+                exploitability = self.track_exploitability(exploitability_rate)
+                self.instrumentation.lap("exploitability")
+                if self.checkpoints is not None:
+                    self.checkpoints.track(self)
+                    self.instrumentation.lap("checkpoint")
+
+                if self.t >= max(iterations, next_check):
+                    if self.is_converged(regret, epsilon) \
+                            and exploitability <= target_exploitability:
+                        break
+                    next_check = self.t + self.get_check_interval(regret, epsilon,
+                                                                  check_rate)
+                self.instrumentation.lap("regret_check")
+
+            if self.checkpoints is not None:
+                self.checkpoints.wait()
+                self.save_checkpoint(checkpoint_path)
+        finally:
+            if self.metrics is not None:
+                self.metrics.flush()
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
+            if self.checkpoints is not None:
+                self.checkpoints.wait()
+                self.checkpoints = None
+
+        return self.t
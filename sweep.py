@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from benchmark import GAMES, SOLVERS, get_cases, get_case_name
+from metrics import get_results
+
+
+def get_config(case, iterations, exploitability_rate, variant, seed):
+    return dict(case, iterations=iterations, exploitability_rate=exploitability_rate,
+                variant=variant, seed=seed)
+
+
+def get_cache_path(cache_dir, config):
+    digest = hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+    return os.path.join(cache_dir, "%s_%s.json" % (get_case_name(config), digest[:12]))
+
+
+def read_result(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_result(path, result):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(result, f)
+    os.replace(temp_path, path)
+
+
+def run_config(config):
+    game = GAMES[config["game"]](config["players"], config["with_information"])
+    solver = SOLVERS[config["solver"]](game, variant=config["variant"], seed=config["seed"])
+    start = time.perf_counter()
+    solver.train(iterations=config["iterations"],
+                 exploitability_rate=config["exploitability_rate"])
+    seconds = time.perf_counter() - start
+
+    return {"config": config,
+            "name": get_case_name(config),
+            "seconds": seconds,
+            **get_results(solver)}
+
+
+def sweep(configs, cache_dir, workers=1, force=False):
+    os.makedirs(cache_dir, exist_ok=True)
+    results = {}
+    pending = []
+    for config in configs:
+        path = get_cache_path(cache_dir, config)
+        result = None if force else read_result(path)
+        if result is not None and result["config"] == config:
+            results[path] = result
+        else:
+            pending.append((path, config))
+
+    if pending:
+        with ProcessPoolExecutor(min(workers, len(pending))) as executor:
+            futures = {executor.submit(run_config, config): path
+                       for path, config in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                results[path] = future.result()
+                write_result(path, results[path])
+                print("%-32s %8d it %10.2fs  exploitability %.6f"
+                      % (results[path]["name"], results[path]["iterations"],
+                         results[path]["seconds"], results[path]["exploitability"]))
+
+    return [results[get_cache_path(cache_dir, config)] for config in configs], len(pending)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Train every configuration of a grid "
+                                                 "and cache the results on disk.")
+    parser.add_argument("--cache-dir", default=os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), "output", "sweep"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--exploitability-rate", type=int, default=100)
+    parser.add_argument("--variant", default="vanilla")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--games", nargs="+", default=list(GAMES), choices=GAMES)
+    parser.add_argument("--players", nargs="+", type=int, default=[2, 3])
+    parser.add_argument("--information", nargs="+", default=["off", "on"],
+                        choices=["off", "on"])
+    parser.add_argument("--solvers", nargs="+", default=list(SOLVERS), choices=SOLVERS)
+    args = parser.parse_args(argv)
+
+    configs = [get_config(case, args.iterations, args.exploitability_rate,
+                          args.variant, args.seed)
+               for case in get_cases(args.games, args.players,
+                                     [i == "on" for i in args.information],
+                                     args.solvers)]
+    results, computed = sweep(configs, args.cache_dir, args.workers, args.force)
+    print("%d configurations, %d computed, %d cached in %s"
+          % (len(results), computed, len(results) - computed, args.cache_dir))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))